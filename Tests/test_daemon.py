@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'electron', 'engine')))
+import daemon
+from daemon import EngineDaemon, warm_worker
+
+# Directory the slow warm-up of the standby workers records their PIDs in, set by the test before they fork
+PID_DIR = None
+
+
+def slow_warm_worker(cache_path):
+    """Warm-up of the standby workers, long enough for the daemon to close while they are still warming up"""
+    with open(os.path.join(PID_DIR, str(os.getpid())), 'w'):
+        pass
+    time.sleep(1)
+    warm_worker(cache_path)
+
+
+def is_alive(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def test_close_stops_warming_standby_pool(tmp_path, monkeypatch):
+    engine = EngineDaemon(workers=2, recycle_after=None, cache_path=None)
+    monkeypatch.setattr(sys.modules[__name__], 'PID_DIR', str(tmp_path))
+    monkeypatch.setattr(daemon, 'warm_worker', slow_warm_worker)
+    engine.recycle()
+    assert engine.health()['warming']
+
+    deadline = time.time() + 10
+    while len(os.listdir(tmp_path)) < engine.workers and time.time() < deadline:
+        time.sleep(0.05)
+    pids = [int(name) for name in os.listdir(tmp_path)]
+    assert len(pids) == engine.workers
+
+    engine.close()
+    assert not engine.health()['warming']
+    assert not any(is_alive(pid) for pid in pids)
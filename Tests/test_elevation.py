@@ -0,0 +1,133 @@
+import os
+import sys
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pytest
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'electron', 'engine')))
+from elevation import DEMTile, RemoteElevation
+
+
+class StubElevationService:
+    """Local stand-in for the USGS point query service. The elevation at (x, y) is x + y.
+    Points with x in 'failing' always answer 500, points with x in 'flaky' answer 503 once.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.failing = set()
+        self.flaky = set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                x, y = float(query['x']), float(query['y'])
+                stub.requests.append((x, y, self.headers.get('X-Client')))
+                if x in stub.failing:
+                    status, body = 500, {}
+                elif x in stub.flaky:
+                    stub.flaky.discard(x)
+                    status, body = 503, {}
+                else:
+                    status, body = 200, {'value': str(x + y)}
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def service():
+    stub = StubElevationService()
+    yield stub
+    stub.close()
+
+
+def provider(service, tmp_path, **kwargs):
+    return RemoteElevation(url=service.url, cache_path=str(tmp_path / "elevation.sqlite"), backoff=0.01, **kwargs)
+
+
+def test_fetches_each_cell_once(service, tmp_path):
+    coords = [(10.2, 20), (10.4, 20.1), (30, 40), (10, 20)]
+    values = provider(service, tmp_path).elevations(coords)
+    assert values.tolist() == [30.0, 30.0, 70.0, 30.0]
+    assert len(service.requests) == 2
+
+
+def test_disk_cache_is_reused(service, tmp_path):
+    coords = np.array([(1, 2), (3, 4), (5, 6)], dtype=float)
+    provider(service, tmp_path).elevations(coords)
+    assert provider(service, tmp_path).elevations(coords).tolist() == [3.0, 7.0, 11.0]
+    assert len(service.requests) == 3
+
+
+def test_retries_with_backoff(service, tmp_path):
+    service.flaky = {7.0}
+    assert provider(service, tmp_path).elevations([(7, 1)]).tolist() == [8.0]
+    assert len(service.requests) == 2
+
+
+def test_failures_keep_fetched_values(service, tmp_path):
+    service.failing = {9.0}
+    with pytest.raises(ConnectionError, match="1 of 3"):
+        provider(service, tmp_path, max_retries=1).elevations([(1, 1), (2, 2), (9, 9)])
+    before = len(service.requests)
+    assert provider(service, tmp_path).elevations([(1, 1), (2, 2)]).tolist() == [2.0, 4.0]
+    assert len(service.requests) == before
+
+
+def test_injected_session(service, tmp_path):
+    session = requests.Session()
+    session.headers['X-Client'] = 'planner-test'
+    elevation = provider(service, tmp_path, session=session)
+    assert elevation.session is session
+    elevation.elevations([(1, 1)])
+    assert service.requests == [(1.0, 1.0, 'planner-test')]
+
+
+def write_ascii_grid(path, rows):
+    header = f"ncols {len(rows[0])}\nnrows {len(rows)}\nxllcorner 0\nyllcorner 0\ncellsize 10\nNODATA_value -9999\n"
+    path.write_text(header + "\n".join(" ".join(str(v) for v in row) for row in rows) + "\n")
+
+
+def test_ascii_grid_cache_stays_out_of_data_dir(tmp_path):
+    data, cache = tmp_path / "data", tmp_path / "cache"
+    data.mkdir()
+    write_ascii_grid(data / "tile.asc", [[1, 2], [3, 4]])
+    tile = DEMTile.from_file(str(data / "tile.asc"), cache_dir=str(cache))
+    assert np.asarray(tile.grid).tolist() == [[1, 2], [3, 4]]
+    assert os.listdir(data) == ["tile.asc"]
+    assert len(os.listdir(cache)) == 1
+
+    # an edited grid replaces its stale cache entry
+    write_ascii_grid(data / "tile.asc", [[5, 6], [7, 8]])
+    os.utime(data / "tile.asc", ns=(0, 10 ** 9))
+    assert np.asarray(DEMTile.from_file(str(data / "tile.asc"), cache_dir=str(cache)).grid).tolist() == [[5, 6], [7, 8]]
+    assert len(os.listdir(cache)) == 1
+
+
+def test_unwritable_cache_dir_is_skipped(tmp_path):
+    write_ascii_grid(tmp_path / "tile.asc", [[1, 2], [3, 4]])
+    blocker = tmp_path / "blocker"
+    blocker.write_text("")
+    tile = DEMTile.from_file(str(tmp_path / "tile.asc"), cache_dir=str(blocker / "cache"))
+    assert np.asarray(tile.grid).tolist() == [[1, 2], [3, 4]]
+    assert sorted(os.listdir(tmp_path)) == ["blocker", "tile.asc"]
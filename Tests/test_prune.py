@@ -0,0 +1,39 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'electron', 'engine')))
+from optimization import *
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def read_field(name):
+    return [gcs2pcs(*c) for c in csv2coords(os.path.join(TESTS_DIR, name))]
+
+
+@pytest.fixture(scope="module")
+def field():
+    children = [Outline('ex1', read_field('exclusion1.csv')), Outline('ex2', read_field('exclusion2.csv'))]
+    return read_field('coordinates.csv'), children
+
+
+@pytest.mark.parametrize("weights", [(75, 15, 10), (40, 40, 20)])
+def test_pruning_keeps_best_path(field, weights):
+    coords, children = field
+    optimizer = airtime_coverage_weighted(*weights)
+    full, _ = construct_pathlist(coords, 20, children=children, num_path=10)
+    pruned, _ = construct_pathlist(coords, 20, children=children, num_path=10, prune=True, optimizer=optimizer)
+
+    assert len(pruned) + pruned.attrs['pruned'] == len(full)
+    _, best = find_best_path(full, optimizer)
+    _, pruned_best = find_best_path(pruned, optimizer)
+    assert np.array_equal(best.vertices, pruned_best.vertices)
+
+
+def test_pruning_skips_candidates_under_default_weights(field):
+    coords, children = field
+    pruned, _ = construct_pathlist(coords, 20, children=children, num_path=10, prune=True,
+                                   optimizer=airtime_coverage_weighted(75, 15, 10))
+    assert pruned.attrs['pruned'] >= len(pruned)
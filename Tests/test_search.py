@@ -0,0 +1,35 @@
+import os
+import sys
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'electron', 'engine')))
+from optimization import *
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+COLUMNS = ['Airtime', 'Seeding_Efficiency', 'Spill_Area']
+
+
+def read_field(name):
+    return [gcs2pcs(*c) for c in csv2coords(os.path.join(TESTS_DIR, name))]
+
+
+@pytest.fixture(scope="module")
+def field():
+    children = [Outline('ex1', read_field('exclusion1.csv')), Outline('ex2', read_field('exclusion2.csv'))]
+    return read_field('coordinates.csv'), children
+
+
+def test_angle_search_beats_grid_with_fewer_evaluations(field):
+    coords, children = field
+    optimizer = airtime_coverage_weighted(75, 15, 10)
+    grid, _ = construct_pathlist(coords, 20, children=children, num_path=10)
+    angle, _ = construct_pathlist(coords, 20, children=children, num_path=10, search="angle", optimizer=optimizer)
+    assert len(angle) < len(grid)
+
+    # score both searches on the same normalization
+    pooled = pd.concat([grid[COLUMNS], angle[COLUMNS]], ignore_index=True)
+    pooled = (pooled - pooled.min()) / (pooled.max() - pooled.min())
+    optimizer(pooled)
+    scores = pooled['Composite_Score'].to_numpy()
+    assert scores[len(grid):].max() >= scores[:len(grid)].max()
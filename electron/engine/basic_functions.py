@@ -1,12 +1,12 @@
 import numpy as np
+import shapely
 import matplotlib.pyplot as plt
-from pyproj import Transformer
+from transform import GCS, PCS, BCCS, transform_coords
+from elevation import get_elevation_provider
 from shapely.geometry import LineString, Point, MultiPoint, Polygon, MultiPolygon
 import geopandas as gpd
 import random
 import csv
-import urllib.parse
-import requests
 import time
 
 """
@@ -42,6 +42,48 @@ def extractGeoTypes(geometry):
     return polygons #, points
 
 
+def simplify_field(coords, children_coords, tolerance):
+    """Simplifies a field and its children together with Douglas-Peucker, preserving their topology:
+    rings stay simple, and children stay inside the field and apart from each other.
+    Returns the simplified (closed) field coordinates, the simplified children coordinates and a report of the change.
+
+    coords:             list of (x, y) coordinates of the field
+    children_coords:    list of lists of (x, y) coordinates, one per child
+    tolerance:          maximum distance (m) between a simplified ring and the original one
+
+    The report is a dictionary of
+        vertices_before, vertices_after:            number of vertices of all rings
+        desired_area_before, desired_area_after:    area of the field excluding children (KM^2)
+        desired_area_change:                        desired_area_after - desired_area_before (KM^2)
+        changed_area:                               area added or removed by the simplification (KM^2)
+    """
+    field = Polygon(coords, [child for child in children_coords])
+    if field.is_valid:
+        # all rings are simplified as one polygon, so they can't cross each other
+        simple = shapely.simplify(field, tolerance, preserve_topology=True)
+        shell, holes = simple.exterior, list(simple.interiors)
+    else:
+        # overlapping children can't be holes of one polygon, each ring is simplified on its own
+        shell = shapely.simplify(Polygon(coords), tolerance, preserve_topology=True).exterior
+        holes = [shapely.simplify(Polygon(child), tolerance, preserve_topology=True).exterior for child in children_coords]
+    new_field = Polygon(shell, holes)
+
+    def desired_area(polygon):
+        return (Polygon(polygon.exterior).area - sum([Polygon(ring).area for ring in polygon.interiors])) / 1000**2
+
+    report = {
+        'vertices_before': len(field.exterior.coords) + sum([len(ring.coords) for ring in field.interiors]),
+        'vertices_after': len(shell.coords) + sum([len(ring.coords) for ring in holes]),
+        'desired_area_before': desired_area(field),
+        'desired_area_after': desired_area(new_field),
+        'changed_area': shapely.symmetric_difference(Polygon(field.exterior), Polygon(shell)).area / 1000**2
+                        + sum([shapely.symmetric_difference(Polygon(old), Polygon(new)).area
+                               for old, new in zip(children_coords, holes)]) / 1000**2,
+    }
+    report['desired_area_change'] = report['desired_area_after'] - report['desired_area_before']
+    return list(shell.coords), [list(ring.coords) for ring in holes], report
+
+
 """
 ======================
 === Vector Related ===
@@ -120,6 +162,29 @@ def line_angle(line1: LineString, line2: LineString):
     return angle
 
 
+def turn_angles(vertices) -> np.ndarray:
+    """Returns the angle (degrees) between every pair of consecutive lines of a path, like line_angle() does for one pair.
+    The i-th angle is formed by the lines vertices[i] -> vertices[i+1] and vertices[i+1] -> vertices[i+2].
+    Angles next to a zero-length line are returned as 0.
+
+    vertices: (N, 2) array of the path vertices
+    """
+    vec = np.diff(np.asarray(vertices, dtype=np.float64), axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        unit = vec / np.sqrt(vec[:, 0] ** 2 + vec[:, 1] ** 2)[:, None]
+        #Clip to account for python rounding error, else arccos() is undefined
+        dot = np.clip(unit[:-1, 0] * unit[1:, 0] + unit[:-1, 1] * unit[1:, 1], -1, 1)
+    angles = np.nan_to_num(np.rad2deg(np.arccos(dot)))
+
+    # The airtime model branches on an angle being exactly 0 and on it being <= 90.
+    # Angles close to either are recomputed with the scalar arithmetic of line_angle(), so rounding decides those the same way.
+    for i in np.flatnonzero((angles < 1e-4) | (np.abs(angles - 90) < 1e-4)):
+        if vec[i].any() and vec[i+1].any():
+            dot = np.dot(normalizeVec(*vec[i].tolist()), normalizeVec(*vec[i+1].tolist()))
+            angles[i] = np.rad2deg(np.arccos(min(max(dot, -1), 1)))
+    return angles
+
+
 def line_intersection(point1: Point, slope1, point2: Point, slope2):
     """Finds the point of intersection between two straight lines given the point and slope of both lines.
 
@@ -213,20 +278,71 @@ def merge_line(linelist: list[LineString]):
     """Merge a list of continuous 2-point LineStrings into one single multi-point LineString
     Returns a single LineString object
     """
-    coords = []
-    start_coord = None
-    for line in linelist:
-        firstpoint = line.boundary.geoms[0]
-        secondpoint = line.boundary.geoms[1]
-        if not start_coord:
-            coords.append(firstpoint)
-            coords.append(secondpoint)
-            start_coord = secondpoint
-        else:
-            assert firstpoint == start_coord, "Lines are not continuous"
-            coords.append(secondpoint)
-            start_coord = secondpoint
-    return LineString(coords)
+    return LineString(vertices_from_lines(linelist))
+
+
+def vertices_from_lines(linelist: list[LineString]) -> np.ndarray:
+    """Merge a list of continuous LineStrings into the (N, 2) array of vertices they pass through.
+    The shared point between two consecutive lines appears once.
+    """
+    assert len(linelist) > 0, "The list of lines must not be empty"
+    coords, index = shapely.get_coordinates(linelist, return_index=True)
+    # first and last coordinate of every line
+    firsts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+    lasts = np.r_[firsts[1:] - 1, len(coords) - 1]
+    assert (coords[lasts[:-1]] == coords[firsts[1:]]).all(), "Lines are not continuous"
+    keep = np.ones(len(coords), dtype=bool)
+    keep[firsts[1:]] = False
+    return coords[keep]
+
+
+def densify_vertices(vertices, counts) -> np.ndarray:
+    """Breaks every line of the path through 'vertices' into counts[i] equal parts, all lines at once.
+    Returns the (counts.sum() + 1, 2) array of waypoints, the vertices included.
+
+    vertices:   (N, 2) array of the path vertices
+    counts:     (N - 1) integer array, number of parts of every line (at least 1)
+    """
+    p, q = vertices[:-1], vertices[1:]
+    line = np.repeat(np.arange(len(p)), counts)
+    # index of every waypoint along its line, 0 being the line's start vertex
+    step = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    t = step / counts[line]
+    waypoints = p[line] + t[:, None] * (q[line] - p[line])
+    return np.concatenate((waypoints, vertices[-1:]))
+
+
+def scanline_crossings(rings, levels):
+    """Intersects the horizontal lines y = level with the edges of closed rings, all lines at once.
+    The edges are tabled with the range of lines they span (found by binary search in the sorted levels),
+    and the crossings are sorted by line then x. A line through a vertex crosses it once, a line along an edge crosses both its ends.
+    Returns (line, x): the index of the line and the x coordinate of every crossing, without duplicates.
+
+    rings:  a list of (N, 2) arrays of ring coordinates, first and last being equal
+    levels: sorted 1D array of the y of the lines
+    """
+    p = np.concatenate([ring[:-1] for ring in rings])
+    q = np.concatenate([ring[1:] for ring in rings])
+    first = np.searchsorted(levels, np.minimum(p[:, 1], q[:, 1]), side='left')
+    last = np.searchsorted(levels, np.maximum(p[:, 1], q[:, 1]), side='right')
+    counts = last - first
+    edge = np.repeat(np.arange(len(p)), counts)
+    line = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    y = levels[line]
+    pe, qe = p[edge], q[edge]
+    dy = qe[:, 1] - pe[:, 1]
+    flat = dy == 0
+    x = pe[:, 0] + (y - pe[:, 1]) / np.where(flat, 1, dy) * (qe[:, 0] - pe[:, 0])
+    # lines through a vertex take its exact x, so that both edges of the vertex give the same crossing
+    x = np.where(y == pe[:, 1], pe[:, 0], np.where(y == qe[:, 1], qe[:, 0], x))
+    line = np.r_[line, line[flat]]
+    x = np.r_[x, qe[flat, 0]]
+
+    order = np.lexsort((x, line))
+    line, x = line[order], x[order]
+    keep = np.r_[True, (line[1:] != line[:-1]) | (x[1:] != x[:-1])]
+    return line[keep], x[keep]
 
 
 def check_continuity(lines: list[LineString]):
@@ -332,8 +448,12 @@ def shp2coords(shapefile_path):
             for polygon in poly_list:
                 coordinates.append(extract_coords(polygon))
         # Convert to EPSG 3857 coordinates and return
+        # * All polygons are stacked and transformed in a single call, then split back up
         startTime = time.time()
-        transformed_coordinates = [bccs2gcs_batch(coord) for coord in coordinates]
+        source_crs = gdf.crs if gdf.crs else BCCS
+        stacked = transform_coords(np.concatenate([np.asarray(coord, dtype=np.float64) for coord in coordinates]), source_crs, PCS)
+        bounds = np.cumsum([len(coord) for coord in coordinates])[:-1]
+        transformed_coordinates = [arr.tolist() for arr in np.split(stacked, bounds)]
         endTime = time.time()
         print(endTime - startTime)
         return transformed_coordinates
@@ -349,59 +469,43 @@ def shp2coords(shapefile_path):
 def gcs2pcs(lon, lat):
     """Converts EPSG:4326 (lon&lat) to EPSG:3857 (meters)
     """
-    assert lat >= -90 and lat <= 90, "Latitude not in range. Input is lon, lat, you may have reversed them."
-    transformer = Transformer.from_crs(
-        "EPSG:4326", "EPSG:3857", always_xy=True)
-    x, y = transformer.transform(lon, lat)
-    if x == np.inf or y == np.inf:
-        raise ValueError(
-            "input should be in sequence of (Longtitude, Latitude), it may be currently reversed")
+    x, y = transform_coords([(lon, lat)], GCS, PCS)[0]
     return x, y
 
 
 def pcs2gcs(x, y):
     """Converts EPSG:3857 (meters) to EPSG:4326 (lon&lat)
     """
-    transformer = Transformer.from_crs(
-        "EPSG:3857", "EPSG:4326", always_xy=True)
-    lon, lat = transformer.transform(x, y)
+    lon, lat = transform_coords([(x, y)], PCS, GCS)[0]
     return lon, lat
 
 
 def bccs2gcs(x, y):
     """Converts EPSG:3005 (meters) to EPSG:3857 (meters)
     """
-    transformer = Transformer.from_crs(
-        "EPSG:3005", "EPSG:3857", always_xy=True)
-    x, y = transformer.transform(x, y)
-    if x == np.inf or y == np.inf:
-        raise ValueError(
-            "input should be in sequence of (Longtitude, Latitude), it may be currently reversed")
+    x, y = transform_coords([(x, y)], BCCS, PCS)[0]
     return x, y
 
 
-def gcs2pcs_batch(coords, prefix="gcs2pcs Conversion: "):
+def gcs2pcs_batch(coords):
     """Converts EPSG:4326 (lon&lat) to EPSG:3857 (meters)
     but input is a whole list of EPSG:4326 coordinates
     """
-    print()
-    return [list(gcs2pcs(pt[0], pt[1])) for pt in print_progress(coords, prefix=prefix)]
+    return transform_coords(coords, GCS, PCS).tolist()
 
 
-def pcs2gcs_batch(coords, prefix="pcs2gcs Conversion: "):
+def pcs2gcs_batch(coords):
     """Converts EPSG:3857 (meters) to EPSG:4326 (lon&lat)
     but input is a whole list of EPSG:3857 coordinates
     """
-    print()
-    return [list(pcs2gcs(pt[0], pt[1])) for pt in print_progress(coords, prefix=prefix)]
+    return transform_coords(coords, PCS, GCS).tolist()
 
 
-def bccs2gcs_batch(coords, prefix="bccs2gcs Conversion: "):
+def bccs2gcs_batch(coords):
     """Converts EPSG:3005 (meters) to EPSG:3857 (meters)
     but input is a whole list of EPSG:3005 coordinates
     """
-    print()
-    return [list(bccs2gcs(pt[0], pt[1])) for pt in print_progress(coords, prefix=prefix)]
+    return transform_coords(coords, BCCS, PCS).tolist()
 
 
 """
@@ -409,34 +513,16 @@ def bccs2gcs_batch(coords, prefix="bccs2gcs Conversion: "):
 === Others ===
 ==============
 """
-def get_elevation(coordinates):
-    """Uses the usgs api to obtain elevation data
-    coordinate: tuple of (longtitude, latitude)
+def get_elevation(coordinates, provider=None):
+    """Obtains elevation data for a list of EPSG:3857 coordinates.
+    Uses 'provider' when given, otherwise the default provider (see elevation.set_elevation_provider),
+    which is the pooled and disk-cached USGS api client unless another one is set.
+
+    coordinates: list of (x, y) tuples, in EPSG:3857 (meters)
+    provider:    an elevation provider, e.g. elevation.DEMElevation or elevation.RemoteElevation
     """
-    #public API url
-    url = r'https://epqs.nationalmap.gov/v1/json?'
-    elevation=[]
-    
-    num_pts = len(coordinates)
-    print()
-    print(f"Note: Accessing elevation data takes time on public API. Estimated time {int(num_pts/2//60)} mins {int(num_pts/2%60)} secs")
-    for coord in print_progress(coordinates):       
-        #define url parameters for API request
-        params = {
-            'output': 'json',
-            'x': coord[0],
-            'y': coord[1],
-            'wkid': 102100,
-            'units': 'Meters'
-        }
-        json_result = requests.get((url + urllib.parse.urlencode(params))).json()
-        #Parse the .json file format and extract the 'value', which is the elevation data
-        try:
-            elevation.append(float(json_result['value']))
-        except KeyError:
-            raise ConnectionError("The API doesn't have elevation data at this point. Please check the validity of the coordinate input.")
-                
-    return elevation
+    provider = provider if provider is not None else get_elevation_provider()
+    return provider.elevations(coordinates).tolist()
 
 def arbit_list(num, min, max):
     """
@@ -0,0 +1,251 @@
+# src/coverage.py
+
+import numpy as np
+import shapely
+from shapely.geometry import LineString
+
+"""
+========================
+=== Coverage Metrics ===
+========================
+
+Description of the coverage engine used by the Path class.
+
+#TL:DR
+swath_coverage() buffers the path into the area seeded by the drone. Long paths are buffered in chunks of
+consecutive lines that are merged with a tree union, so no single buffer operation grows with the path length.
+coverage_metrics() computes every coverage quantity of a path from that one coverage polygon in a single pass.
+RasterGrid is the approximate alternative for screening many candidates: the field, its children and the swath
+corridor are rasterized onto a grid and every area is counted in cells, together with an estimate of its error.
+"""
+
+# Paths with more lines than this are buffered chunk by chunk and merged with a tree union.
+# On a 12k-line path this is about 3x faster than one buffer when the swaths are long, and within 20% otherwise.
+COVERAGE_CHUNK_SIZE = 2000
+
+
+def swath_coverage(vertices, disp_diam, chunk_size=COVERAGE_CHUNK_SIZE):
+    """Returns the area covered by the drone flying through 'vertices', as a Polygon (or MultiPolygon)
+
+    vertices:   (N, 2) array of the path vertices
+    disp_diam:  dispersion diameter of the drone
+    chunk_size: number of lines buffered together. Paths of at most 'chunk_size' lines are buffered as a whole.
+    """
+    radius = disp_diam / 2
+    num_lines = len(vertices) - 1
+    if num_lines <= chunk_size:
+        return LineString(vertices).buffer(radius, quad_segs=3)
+
+    # consecutive chunks share their end vertex, so the chunks' round caps close the joins between them
+    chunks = [LineString(vertices[i:i + chunk_size + 1]) for i in range(0, num_lines, chunk_size)]
+    buffers = shapely.buffer(chunks, radius, quad_segs=3)
+    # GEOS merges the buffers with a cascaded union over an STRtree of their envelopes
+    return shapely.union_all(buffers)
+
+
+def coverage_metrics(coverage, outer_poly, outline) -> dict:
+    """Computes all coverage quantities of a path in one pass. Areas are in KM^2.
+    Children are looked up through the outline's spatial index, so only the ones touching the coverage are intersected.
+
+    coverage:   the coverage polygon of the path, see swath_coverage()
+    outer_poly: the Outline of the whole field (the offset parent of the path's outline, if there is one)
+    outline:    the Outline the path was generated from, whose children are excluded from the field
+
+    Returns a dictionary of
+        seed_disp_area:         seeded area within the field, excluding children
+        total_covered_area:     total area covered by the drone
+        desired_coverage:       area of the field, excluding children
+        excluded_covered_area:  area of the children covered by the drone
+    """
+    total_drone_covered_area = coverage.area / 1000**2
+
+    #Total internal exclusion area (KM^2) and Total internal exclusion area covered by drone
+    excluded_area = 0
+    drone_covered_excluded_area = 0
+    if outer_poly.children:
+        excluded_area = sum([child.polygon.area for child in outer_poly.children.values()]) / 1000**2
+        child_polygons = [child.polygon for child in outline.query_children(coverage)]
+        if child_polygons:
+            # clipping the coverage to each child's bounding box first keeps every intersection local to that child
+            local = [shapely.clip_by_rect(coverage, *polygon.bounds) for polygon in child_polygons]
+            overlaps = shapely.intersection(local, child_polygons)
+            drone_covered_excluded_area = shapely.area(overlaps).sum() / 1000**2
+
+    #Total field area desired to be covered
+    desired_coverage = outer_poly.polygon.area / 1000**2 - excluded_area
+
+    #Total seed dispersed area by drone
+    covered_field_area = coverage.intersection(outer_poly.polygon).area / 1000**2
+    seed_disp_area = covered_field_area - drone_covered_excluded_area
+
+    return {
+        'seed_disp_area': seed_disp_area,
+        'total_covered_area': total_drone_covered_area,
+        'desired_coverage': desired_coverage,
+        'excluded_covered_area': drone_covered_excluded_area,
+    }
+
+
+def coverage_bounds(length, disp_diam, desired_coverage):
+    """Bounds the coverage quantities of a path from its length alone, without any polygon operation.
+    The drone covers at most a corridor of width disp_diam along the path, plus the round caps at its two ends.
+
+    length:             total length (m) of the path
+    disp_diam:          dispersion diameter of the drone
+    desired_coverage:   area (KM^2) of the field, excluding children
+
+    Returns ((low, high) seeding efficiency in %, (low, high) spilled area in KM^2)
+    """
+    covered = (length * disp_diam + np.pi * (disp_diam / 2)**2) / 1000**2
+    seeded = min(covered, desired_coverage)
+    return (0.0, seeded / desired_coverage * 100), (0.0, covered)
+
+
+"""
+=======================
+=== Raster Coverage ===
+=======================
+"""
+
+class RasterGrid:
+    """
+    A RasterGrid rasterizes a field and its children once, then estimates the coverage metrics of any path over that
+    field from cell counts. Areas are accurate to about the area of the cells on the boundary of each region,
+    which is reported with every result.
+    """
+
+    def __init__(self, outer_poly, children, cell_size, margin=0):
+        """
+        outer_poly: the Outline of the whole field
+        children:   the Outline objects excluded from the field
+        cell_size:  size (m) of a grid cell
+        margin:     distance (m) the grid extends beyond the field, at least the swath radius
+        """
+        self.cell_size = cell_size
+        pad = margin + 2 * cell_size
+        self.x0 = outer_poly.xmin - pad
+        self.y0 = outer_poly.ymin - pad
+        self.ncols = int(np.ceil((outer_poly.xmax + pad - self.x0) / cell_size))
+        self.nrows = int(np.ceil((outer_poly.ymax + pad - self.y0) / cell_size))
+
+        self.field = self.rasterize(outer_poly.ring_coords)
+        self.excluded = np.zeros_like(self.field)
+        for child in children:
+            self.excluded |= self.rasterize(child.ring_coords)
+
+        # desired coverage is exact, it only depends on the polygons
+        excluded_area = sum([child.polygon.area for child in children]) / 1000**2
+        self.desired_coverage = outer_poly.polygon.area / 1000**2 - excluded_area
+
+    def rasterize(self, ring) -> np.ndarray:
+        """Returns a (nrows, ncols) boolean mask of the cells whose centre lies inside the closed 'ring'.
+        Scanline fill with the even-odd rule: the crossings of every cell row with every edge are found at once,
+        sorted per row and filled pairwise through a cumulative sum.
+
+        ring: (N, 2) array of the ring coordinates, first and last being equal
+        """
+        cs = self.cell_size
+        p, q = ring[:-1], ring[1:]
+        row_centres = self.y0 + (np.arange(self.nrows) + 0.5) * cs
+
+        # rows crossed by each edge: min(y) <= yc < max(y)
+        low, high = np.minimum(p[:, 1], q[:, 1]), np.maximum(p[:, 1], q[:, 1])
+        first = np.ceil((low - self.y0) / cs - 0.5).astype(np.intp)
+        last = np.ceil((high - self.y0) / cs - 0.5).astype(np.intp)
+        counts = np.clip(last - first, 0, None)
+        edge = np.repeat(np.arange(len(p)), counts)
+        rows = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        # x of every crossing
+        t = (row_centres[rows] - p[edge, 1]) / (q[edge, 1] - p[edge, 1])
+        xs = p[edge, 0] + t * (q[edge, 0] - p[edge, 0])
+        order = np.lexsort((xs, rows))
+        rows, xs = rows[order], xs[order]
+
+        # fill between crossing pairs (0, 1), (2, 3), ... of each row
+        start = np.clip(np.ceil((xs[0::2] - self.x0) / cs - 0.5), 0, self.ncols).astype(np.intp)
+        stop = np.clip(np.floor((xs[1::2] - self.x0) / cs - 0.5) + 1, 0, self.ncols).astype(np.intp)
+        fill = np.zeros((self.nrows, self.ncols + 1), dtype=np.int32)
+        np.add.at(fill, (rows[0::2], start), 1)
+        np.add.at(fill, (rows[0::2], stop), -1)
+        return np.cumsum(fill, axis=1)[:, :-1] > 0
+
+    def corridor(self, vertices, disp_diam) -> np.ndarray:
+        """Returns the mask of the cells whose centre lies within disp_diam / 2 of the path.
+        Every line of the path widened by disp_diam / 2 is a capsule, a rectangle with a half disc at each end.
+        A cell row crosses a capsule along a single interval, bounded by the row's crossings with the rectangle's
+        edges and with the two discs. The intervals of every (line, row) pair are filled at once, as in rasterize().
+        """
+        cs = self.cell_size
+        radius = disp_diam / 2
+        p, q = vertices[:-1], vertices[1:]
+
+        # rows whose centre is within reach of each line
+        low = np.minimum(p[:, 1], q[:, 1]) - radius
+        high = np.maximum(p[:, 1], q[:, 1]) + radius
+        first = np.clip(np.ceil((low - self.y0) / cs - 0.5), 0, self.nrows).astype(np.intp)
+        stop = np.clip(np.floor((high - self.y0) / cs - 0.5) + 1, 0, self.nrows).astype(np.intp)
+        counts = np.clip(stop - first, 0, None)
+        seg = np.repeat(np.arange(len(p)), counts)
+        rows = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        yc = self.y0 + (rows + 0.5) * cs
+
+        lo = np.full(len(rows), np.inf)
+        hi = np.full(len(rows), -np.inf)
+        # the discs around both ends of each line
+        for end in (p, q):
+            cx, dy = end[seg, 0], yc - end[seg, 1]
+            half = np.sqrt(np.clip(radius**2 - dy**2, 0, None))
+            inside = np.abs(dy) <= radius
+            lo = np.where(inside, np.minimum(lo, cx - half), lo)
+            hi = np.where(inside, np.maximum(hi, cx + half), hi)
+
+        # the two long edges of the rectangle along each line, its short edges being diameters of the discs.
+        # Zero-length lines are only their disc.
+        d = q - p
+        lengths = np.sqrt((d ** 2).sum(axis=1))
+        normal = np.column_stack((-d[:, 1], d[:, 0])) * (radius / np.where(lengths > 0, lengths, 1))[:, None]
+        has_rect = (lengths > 0)[seg]
+        for a, b in ((p + normal, q + normal), (p - normal, q - normal)):
+            ay, by = a[seg, 1], b[seg, 1]
+            crosses = has_rect & (np.minimum(ay, by) <= yc) & (yc <= np.maximum(ay, by)) & (ay != by)
+            t = (yc - ay) / np.where(ay != by, by - ay, 1)
+            x = a[seg, 0] + t * (b[seg, 0] - a[seg, 0])
+            lo = np.where(crosses, np.minimum(lo, x), lo)
+            hi = np.where(crosses, np.maximum(hi, x), hi)
+
+        # fill the cells whose centre lies in [lo, hi] of each row
+        start = np.clip(np.ceil((lo - self.x0) / cs - 0.5), 0, self.ncols)
+        end = np.clip(np.floor((hi - self.x0) / cs - 0.5) + 1, 0, self.ncols)
+        filled = start < end
+        width = self.ncols + 1
+        size = self.nrows * width
+        rows = rows[filled] * width
+        fill = (np.bincount(rows + start[filled].astype(np.intp), minlength=size)
+                - np.bincount(rows + end[filled].astype(np.intp), minlength=size))
+        return np.cumsum(fill.reshape(self.nrows, width), axis=1)[:, :-1] > 0
+
+    def boundary_area(self, mask) -> float:
+        """Returns half the area (KM^2) of the cells on the boundary of 'mask', the estimated error of its area.
+        The boundary is counted in cell edges between a cell of the mask and a cell outside it.
+        """
+        edges = np.count_nonzero(mask[:, 1:] != mask[:, :-1]) + np.count_nonzero(mask[1:] != mask[:-1])
+        return 0.5 * edges * self.cell_size**2 / 1000**2
+
+    def coverage_metrics(self, vertices, disp_diam) -> dict:
+        """Estimates the coverage quantities of the path through 'vertices', see coverage_metrics().
+        Every area comes with its estimated absolute error under the key '<name>_error'.
+        """
+        cell_area = self.cell_size**2 / 1000**2
+        covered = self.corridor(vertices, disp_diam)
+        seeded = covered & self.field & ~self.excluded
+        excluded_covered = covered & self.excluded
+        return {
+            'seed_disp_area': seeded.sum() * cell_area,
+            'total_covered_area': covered.sum() * cell_area,
+            'desired_coverage': self.desired_coverage,
+            'excluded_covered_area': excluded_covered.sum() * cell_area,
+            'seed_disp_area_error': self.boundary_area(seeded),
+            'total_covered_area_error': self.boundary_area(covered),
+            'excluded_covered_area_error': self.boundary_area(excluded_covered),
+        }
@@ -0,0 +1,363 @@
+# src/daemon.py
+
+import os
+import sys
+import time
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from optimization import *
+from plan_cache import PlanCache, PLAN_CACHE_PATH
+from transform import get_transformer, GCS, PCS, BCCS
+from ipc import read_message, write_message, export_paths
+
+"""
+=====================
+=== Engine Daemon ===
+=====================
+
+Description of the long-lived engine process the GUI sends its planning requests to.
+
+#TL:DR
+The GUI starts `python daemon.py` once and keeps it running, instead of starting a new Python process per request.
+Requests and responses are binary frames on stdin / stdout (see ipc.py), whose coordinate arrays travel as packed
+float64 instead of text. Every request is {"id": ..., "method": ..., "params": {...}} and gets one response
+{"id": ..., "ok": true, "result": ...} or {"id": ..., "ok": false, "error": "..."}. Responses may come out of order.
+Polygons and planned paths only travel in frames: the polygons of a shapefile are read with a "polygons" request,
+planned paths are returned in memory, and writing them to best_path.shp and projected_coordinates.json is optional.
+Polygons are planned in a pool of worker processes. Each worker imports the engine, builds the CRS transformers and
+opens its PlanCache once, then plans request after request with them. The workers are replaced by fresh ones after
+'recycle_after' plans each, or when the "recycle" request is sent. The fresh workers are warmed up while the old ones
+keep planning, and only take over once they are warm, so no request is lost or waits for a cold worker.
+The "health" request is answered right away, even while polygons are being planned.
+"""
+
+# Workers are replaced by fresh processes after planning this many polygons each, which gives back the memory they grew
+RECYCLE_AFTER = 50
+# Seconds between two checks of a worker that the process it works for is still alive
+PARENT_CHECK_INTERVAL = 1
+# Planning options a "plan" request may pass on to construct_pathlist()
+PLAN_OPTIONS = ('poly_offset', 'init_slope', 'end_slope', 'num_path', 'search', 'max_refine', 'coverage', 'cell_size',
+                'reverse', 'simplify', 'prune', 'time_budget')
+
+
+"""
+==============
+=== Daemon ===
+==============
+"""
+class EngineDaemon:
+    """
+    Serves framed requests from one input stream, answering on one output stream. See the module description
+    for the protocol. Methods:
+        health:     status of the daemon: uptime, requests served, plans running, worker recycling
+        polygons:   reads the polygons of a shapefile, see polygons_request()
+        plan:       plans the best path of one polygon, see plan_request()
+        export:     writes planned paths to files, see export_request()
+        recycle:    replaces every worker by a fresh, warmed up one once its current plan is done
+        shutdown:   stops reading requests, finishes the running plans, then exits
+    """
+
+    def __init__(self, workers=1, recycle_after=RECYCLE_AFTER, cache_path=PLAN_CACHE_PATH):
+        """
+        workers:        number of worker processes planning polygons concurrently
+        recycle_after:  number of plans per worker after which the workers are replaced by fresh processes.
+                        None never replaces workers.
+        cache_path:     sqlite file of the workers' PlanCache, None keeps their cache in memory only
+        """
+        self.workers = workers
+        self.recycle_after = recycle_after
+        self.cache_path = cache_path
+        self.start_time = time.time()
+        self.served = 0
+        self.failed = 0
+        self.recycles = 0
+
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._write_lock = threading.Lock()
+        self._running = {}
+        self._output = None
+        # plans submitted to the current pool, and the pool warming up to replace it
+        self._submitted = 0
+        self._standby = None
+        self._pool, _ = self._new_pool()
+
+    def serve(self, instream, outstream) -> int:
+        """Answers the requests read from 'instream' until a "shutdown" request or the end of 'instream'.
+        Running plans are finished and answered before returning. Returns the exit code of the daemon.
+
+        instream:   binary stream the framed requests are read from
+        outstream:  binary stream the framed responses are written to
+        """
+        self._output = outstream
+        while True:
+            try:
+                request = read_message(instream)
+            except (EOFError, ValueError) as e:
+                # the stream cannot be resynchronized after a broken frame
+                print(f"Engine daemon: {e}", file=sys.stderr)
+                self.close()
+                return 1
+            if request is None:
+                break
+            if self.handle(request) == "shutdown":
+                break
+        self.close()
+        return 0
+
+    def handle(self, request):
+        """Answers one request, right away or once its plan is done. Returns its method."""
+        request_id = request.get('id') if isinstance(request, dict) else None
+        method = request.get('method') if isinstance(request, dict) else None
+        try:
+            if method == "health":
+                self.respond(request_id, result=self.health())
+            elif method == "polygons":
+                self.submit(request_id, polygons_request, request.get('params') or {})
+            elif method == "plan":
+                self.submit(request_id, plan_request, request.get('params') or {})
+            elif method == "export":
+                self.submit(request_id, export_request, request.get('params') or {})
+            elif method == "recycle":
+                self.recycle()
+                self.respond(request_id, result=self.health())
+            elif method == "shutdown":
+                self.respond(request_id, result={'running': len(self._running)})
+            else:
+                raise ValueError(f"Unknown method '{method}'. Use 'health', 'polygons', 'plan', 'export', "
+                                 "'recycle' or 'shutdown'")
+        except Exception as e:
+            self.respond(request_id, error=e)
+        return method
+
+    def health(self) -> dict:
+        """Returns the status of the daemon"""
+        with self._lock:
+            return {
+                'status': "ok",
+                'pid': os.getpid(),
+                'uptime': time.time() - self.start_time,
+                'served': self.served,
+                'failed': self.failed,
+                'running': len(self._running),
+                'workers': self.workers,
+                'recycle_after': self.recycle_after,
+                'recycles': self.recycles,
+                'warming': self._standby is not None,
+            }
+
+    def submit(self, request_id, job, params):
+        """Runs job(params) in a worker and answers the request with its result once it is done"""
+        with self._lock:
+            pool = self._pool
+            future = pool.submit(job, params)
+            self._running[future] = pool
+            self._submitted += 1
+            worn_out = self.recycle_after is not None and self._submitted >= self.recycle_after * self.workers
+        future.add_done_callback(lambda future: self._finish(request_id, future, pool))
+        if worn_out:
+            self.recycle(pool)
+
+    def recycle(self, pool=None, warm=True):
+        """Replaces the worker pool by a fresh one. Plans already submitted finish in the old workers,
+        which exit once they are done.
+
+        pool:   only replaces the pool if it is still this one. None replaces the current pool.
+        warm:   if True the current pool keeps taking plans until the fresh workers are warmed up.
+                If False the fresh pool takes the next plans right away, e.g. when the current one is broken.
+        """
+        with self._lock:
+            if pool is not None and pool is not self._pool:
+                return
+            standby = self._standby
+            if standby is None:
+                standby = self._standby = self._new_pool()
+                self.recycles += 1
+            elif warm:
+                return
+            if not warm:
+                old_pool = self._take_over(standby)
+        if not warm:
+            old_pool.shutdown(wait=False)
+            return
+        # outside the lock, since a warm-up already done runs its callback right away
+        remaining = [len(standby[1])]
+        for warmup in standby[1]:
+            warmup.add_done_callback(lambda _: self._warmed(standby, remaining))
+
+    def respond(self, request_id, result=None, error=None):
+        """Writes the response to a request, from any thread"""
+        if error is None:
+            message = {'id': request_id, 'ok': True, 'result': result}
+        else:
+            message = {'id': request_id, 'ok': False, 'error': f"{type(error).__name__}: {error}"}
+        with self._write_lock:
+            write_message(self._output, message)
+
+    def close(self):
+        """Waits for the running plans to be answered and stops the workers"""
+        with self._lock:
+            self._idle.wait_for(lambda: not self._running)
+            pools = [self._pool] + ([self._standby[0]] if self._standby is not None else [])
+            self._standby = None
+        for pool in pools:
+            pool.shutdown(wait=True)
+
+    def _finish(self, request_id, future, pool):
+        """Answers a request once the future of its job is done"""
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            # a worker died (e.g. out of memory), so its pool cannot take new plans anymore
+            self.recycle(pool, warm=False)
+        self.respond(request_id, result=None if error else future.result(), error=error)
+        with self._lock:
+            del self._running[future]
+            if error is None:
+                self.served += 1
+            else:
+                self.failed += 1
+            self._idle.notify_all()
+
+    def _warmed(self, standby, remaining):
+        """Hands the plans over to the standby pool once all of its warm-up tasks are done"""
+        with self._lock:
+            remaining[0] -= 1
+            if remaining[0] or self._standby is not standby:
+                return
+            old_pool = self._take_over(standby)
+        old_pool.shutdown(wait=False)
+
+    def _take_over(self, standby):
+        """Makes the standby pool the current one, with the lock held. Returns the pool it replaces."""
+        old_pool, self._pool = self._pool, standby[0]
+        self._standby = None
+        self._submitted = 0
+        return old_pool
+
+    def _new_pool(self):
+        """Returns a new worker pool, whose workers are started and warmed up right away, and the futures of its
+        warm-up tasks. The pool recycles its workers through the daemon rather than with max_tasks_per_child,
+        so the warm-up tasks never count as plans."""
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_worker, initargs=(self.cache_path,))
+        warmups = [pool.submit(int) for _ in range(self.workers)]
+        return pool, warmups
+
+
+"""
+===============
+=== Workers ===
+===============
+"""
+_worker_cache = None
+
+
+def warm_worker(cache_path):
+    """Warms up a new worker: the engine is imported with this module, the CRS transformers are built
+    and the PlanCache is opened, all once for every plan of this worker. The worker exits when its parent is gone."""
+    global _worker_cache
+    watch_parent()
+    for from_crs, to_crs in ((GCS, PCS), (PCS, GCS), (BCCS, PCS)):
+        get_transformer(from_crs, to_crs)
+    _worker_cache = PlanCache(cache_path)
+
+
+def watch_parent(interval=PARENT_CHECK_INTERVAL):
+    """Exits this worker once the process that started it is gone, e.g. killed before it could stop its workers.
+    An orphaned process is adopted by another one, so its parent PID changes."""
+    parent = os.getppid()
+
+    def watch():
+        while os.getppid() == parent:
+            time.sleep(interval)
+        os._exit(1)
+
+    threading.Thread(target=watch, daemon=True).start()
+
+
+def polygons_request(params) -> list:
+    """Reads the polygons of a shapefile, as asked by a "polygons" request. Runs in a worker.
+
+    params: dictionary of
+        shape_path: path of the .shp file, with its .shx and .dbf next to it
+
+    Returns the list of the (N, 2) vertex arrays of the polygons, in EPSG:3857 (see shp2coords()).
+    """
+    polygons = shp2coords(params['shape_path'])
+    if not polygons:
+        raise ValueError(f"No polygon found in {params['shape_path']}")
+    return [np.asarray(coords, dtype=np.float64) for coords in polygons]
+
+
+def plan_request(params) -> dict:
+    """Plans the best path of one polygon, as asked by a "plan" request. Runs in a worker.
+
+    params: dictionary of
+        coords:     (N, 2) array (or list) of the vertices of the polygon, in EPSG:3857
+        disp_diam:  dispersion diameter of the drone
+        children:   (optional) list of the vertex arrays of the polygon's children
+        weights:    (optional) airtime, seeding and spill weights of airtime_coverage_weighted(), (75, 15, 10) by default
+        any of PLAN_OPTIONS, passed on to construct_pathlist()
+
+    Returns a dictionary of the best path's (N, 2) vertex array, swath slope, airtime, seeding efficiency and spilled area,
+    the number of candidates evaluated and the runtime of the plan.
+    """
+    unknown = set(params) - {'coords', 'disp_diam', 'children', 'weights'} - set(PLAN_OPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown plan parameters {sorted(unknown)}")
+    options = {name: params[name] for name in PLAN_OPTIONS if name in params}
+    children = [Outline(f"child{i}", child) for i, child in enumerate(params.get('children') or [])]
+    optimizer = airtime_coverage_weighted(*params.get('weights', (75, 15, 10)))
+
+    pathlist, runtime = construct_pathlist(params['coords'], params['disp_diam'], children=children or None,
+                                           optimizer=optimizer, cache=_worker_cache, **options)
+    _, best_path = find_best_path(pathlist, optimizer)
+    swath_slope = best_path.swath_slope
+    return {
+        'vertices': best_path.vertices,
+        'swath_slope': swath_slope if isinstance(swath_slope, str) else float(swath_slope),
+        'airtime': float(best_path.airtime),
+        'seeding_efficiency': float(best_path.seeding_coverage_efficiency),
+        'spilled_area': float(best_path.spilled_area),
+        'candidates': len(pathlist),
+        'runtime': runtime,
+    }
+
+
+def export_request(params) -> dict:
+    """Writes planned paths to files, as asked by an "export" request. Runs in a worker.
+
+    params: dictionary of
+        paths:      list of the (N, 2) vertex arrays of the planned paths, in EPSG:3857
+        shape_path: (optional) shapefile to write, see export_paths()
+        json_path:  (optional) JSON file of the projected coordinates to write, see export_paths()
+
+    Returns the dictionary of the files written.
+    """
+    files = {name: params[name] for name in ('shape_path', 'json_path') if params.get(name)}
+    export_paths(params['paths'], **files)
+    return files
+
+
+def protocol_streams():
+    """Returns the (input, output) binary streams of the protocol: stdin and the original stdout.
+    File descriptor 1 is then pointed at stderr, so prints of the engine and its workers never corrupt a frame.
+    """
+    output = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    return sys.stdin.buffer, output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-lived engine process answering framed requests on stdin / stdout")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes planning polygons")
+    parser.add_argument("--recycle-after", type=int, default=RECYCLE_AFTER,
+                        help="number of plans after which a worker is replaced, 0 never replaces workers")
+    parser.add_argument("--no-disk-cache", action="store_true", help="keep the plan cache in memory only")
+    args = parser.parse_args()
+
+    instream, outstream = protocol_streams()
+    daemon = EngineDaemon(args.workers, args.recycle_after or None, None if args.no_disk_cache else PLAN_CACHE_PATH)
+    sys.exit(daemon.serve(instream, outstream))
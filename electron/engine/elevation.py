@@ -0,0 +1,517 @@
+# src/elevation.py
+
+import os
+import glob
+import time
+import hashlib
+import struct
+import sqlite3
+import threading
+from contextlib import closing
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from transform import PCS, as_coord_array, transform_coords
+
+"""
+==========================
+=== Elevation Provider ===
+==========================
+
+Description of the elevation providers used by get_elevation(), the Path elevation properties and show3Dpath().
+
+#TL:DR
+An elevation provider takes an (N, 2) array of EPSG:3857 coordinates and returns N elevations (m) in one call.
+DEMElevation reads local GeoTIFF (.tif) / ESRI ASCII grid (.asc) DEM tiles as memory-mapped arrays and
+samples them with vectorized bilinear interpolation, so no network is needed.
+RemoteElevation queries an elevation web service (the public USGS API by default) over a pooled session
+with bounded concurrency, retries, de-duplication and a persistent on-disk cache.
+A provider set with set_elevation_provider() becomes the default of get_elevation(). With no provider set,
+get_elevation() falls back to a shared RemoteElevation instance.
+"""
+
+USGS_EPQS_URL = "https://epqs.nationalmap.gov/v1/json"
+ELEVATION_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "elevation_cache.sqlite")
+# Parsed ESRI ASCII grids are cached as .npy files here, next to the elevation cache rather than in the user's data
+DEM_CACHE_DIR = os.path.join(os.path.dirname(ELEVATION_CACHE_PATH), "dem_cache")
+
+_default_provider = None
+_remote_provider = None
+
+
+def set_elevation_provider(provider):
+    """Sets the default elevation provider used by get_elevation(). Pass None to fall back to the remote USGS API.
+
+    provider: an object with an elevations(coords) method, e.g. a DEMElevation instance
+    """
+    global _default_provider
+    _default_provider = provider
+
+
+def get_elevation_provider():
+    """Returns the default elevation provider. Without one set, a RemoteElevation instance is
+    created once and shared so that its connection pool and cache stay warm between calls.
+    """
+    global _remote_provider
+    if _default_provider is not None:
+        return _default_provider
+    if _remote_provider is None:
+        _remote_provider = RemoteElevation()
+    return _remote_provider
+
+
+class DEMTile:
+    """
+    A DEMTile is a single north-up elevation raster. The grid is held as a (possibly memory-mapped) 2D array,
+    so only the pages containing sampled cells are ever read from disk.
+    """
+
+    def __init__(self, grid, xmin, ymax, dx, dy, nodata=None, crs=PCS):
+        """
+        grid:       2D array of elevations, row 0 is the northern edge
+        xmin, ymax: coordinates of the top-left corner of the top-left cell
+        dx, dy:     cell size in x and y (both positive)
+        nodata:     value in 'grid' marking missing data
+        crs:        CRS of the raster
+        """
+        assert grid.ndim == 2 and min(grid.shape) >= 2, "DEM grid must be 2D and at least 2x2 cells"
+        self.grid = grid
+        self.nrows, self.ncols = grid.shape
+        self.dx, self.dy = float(dx), float(dy)
+        self.xmin, self.ymax = float(xmin), float(ymax)
+        self.xmax = self.xmin + self.ncols * self.dx
+        self.ymin = self.ymax - self.nrows * self.dy
+        self.nodata = nodata
+        self.crs = crs
+
+    def contains(self, xy) -> np.ndarray:
+        """Returns a boolean mask of the points (in the tile's CRS) that fall inside the tile"""
+        return (xy[:, 0] >= self.xmin) & (xy[:, 0] <= self.xmax) & (xy[:, 1] >= self.ymin) & (xy[:, 1] <= self.ymax)
+
+    def sample(self, xy) -> np.ndarray:
+        """Bilinearly interpolates the grid at every point of 'xy' (in the tile's CRS).
+        Points within half a cell of the edge are clamped to the outermost cell centres.
+        Returns NaN wherever one of the four surrounding cells is nodata.
+        """
+        # fractional row / column index relative to cell centres
+        col = np.clip((xy[:, 0] - self.xmin) / self.dx - 0.5, 0, self.ncols - 1)
+        row = np.clip((self.ymax - xy[:, 1]) / self.dy - 0.5, 0, self.nrows - 1)
+        c0 = np.minimum(col.astype(np.intp), self.ncols - 2)
+        r0 = np.minimum(row.astype(np.intp), self.nrows - 2)
+        tc = (col - c0)[:, None]
+        tr = (row - r0)[:, None]
+
+        # gather the 4 surrounding cells as an (N, 2, 2) block, read straight from the memory map
+        block = np.stack([self.grid[r0, c0], self.grid[r0, c0 + 1],
+                          self.grid[r0 + 1, c0], self.grid[r0 + 1, c0 + 1]], axis=1).astype(np.float64)
+        if self.nodata is not None:
+            block[np.isclose(block, self.nodata)] = np.nan
+
+        top = block[:, 0:1] * (1 - tc) + block[:, 1:2] * tc
+        bottom = block[:, 2:3] * (1 - tc) + block[:, 3:4] * tc
+        return (top * (1 - tr) + bottom * tr)[:, 0]
+
+    """
+    ===============
+    === Loaders ===
+    ===============
+    """
+
+    @classmethod
+    def from_file(cls, filepath, crs=None, cache_dir=DEM_CACHE_DIR):
+        """Loads a DEM tile from a GeoTIFF (.tif/.tiff) or ESRI ASCII grid (.asc) file
+
+        filepath:   path to the DEM file
+        crs:        CRS of the raster. Read from the GeoTIFF keys when not given, EPSG:3857 otherwise.
+        cache_dir:  directory caching parsed ASCII grids, see from_ascii_grid()
+        """
+        ext = os.path.splitext(filepath)[1].lower()
+        if ext in (".tif", ".tiff"):
+            return cls.from_geotiff(filepath, crs)
+        if ext == ".asc":
+            return cls.from_ascii_grid(filepath, crs, cache_dir)
+        raise ValueError(f"Unsupported DEM format '{ext}'. Use a GeoTIFF (.tif) or ESRI ASCII grid (.asc) file")
+
+    @classmethod
+    def from_ascii_grid(cls, filepath, crs=None, cache_dir=DEM_CACHE_DIR):
+        """Loads an ESRI ASCII grid. The text grid is parsed once and cached as a .npy file in 'cache_dir',
+        keyed by the path and modification time of the .asc, which is then memory-mapped on every later load.
+        The grid is parsed on every load if 'cache_dir' is None or cannot be written.
+        """
+        header = {}
+        with open(filepath, "r") as f:
+            while True:
+                pos = f.tell()
+                line = f.readline()
+                key = line.split()[0].lower() if line.split() else ""
+                if not key or not key[0].isalpha():
+                    f.seek(pos)
+                    break
+                header[key] = float(line.split()[1])
+            num_header = len(header)
+
+        ncols, nrows = int(header["ncols"]), int(header["nrows"])
+        dx = header.get("cellsize", header.get("dx"))
+        dy = header.get("cellsize", header.get("dy"))
+        if "xllcenter" in header:
+            xmin = header["xllcenter"] - dx / 2
+        else:
+            xmin = header["xllcorner"]
+        if "yllcenter" in header:
+            ymin = header["yllcenter"] - dy / 2
+        else:
+            ymin = header["yllcorner"]
+
+        cache = _grid_cache_path(filepath, cache_dir) if cache_dir is not None else None
+        if cache is not None and os.path.exists(cache):
+            grid = np.load(cache, mmap_mode="r")
+        else:
+            grid = np.loadtxt(filepath, skiprows=num_header, dtype=np.float32, ndmin=2)
+            assert grid.shape == (nrows, ncols), f"{filepath} has {grid.shape} cells, header says {(nrows, ncols)}"
+            if cache is not None and _store_grid(cache, grid):
+                grid = np.load(cache, mmap_mode="r")
+
+        return cls(grid, xmin, ymin + nrows * dy, dx, dy, header.get("nodata_value"), crs or PCS)
+
+    @classmethod
+    def from_geotiff(cls, filepath, crs=None):
+        """Loads a single-band, uncompressed, strip-organized GeoTIFF as a memory map.
+        Compressed or tiled files should be converted first, e.g. 'gdal_translate -co COMPRESS=NONE in.tif out.tif'.
+        """
+        tags = _read_tiff_tags(filepath)
+
+        if tags.get(259, [1])[0] != 1:
+            raise ValueError(f"{filepath} is compressed. Only uncompressed GeoTIFFs can be memory-mapped")
+        if 322 in tags:
+            raise ValueError(f"{filepath} is tiled. Only strip-organized GeoTIFFs can be memory-mapped")
+        if tags.get(277, [1])[0] != 1:
+            raise ValueError(f"{filepath} has more than one band")
+
+        ncols, nrows = tags[256][0], tags[257][0]
+        bits = tags.get(258, [8])[0]
+        sample_format = {1: "u", 2: "i", 3: "f"}[tags.get(339, [1])[0]]
+        dtype = np.dtype(f"{tags['byteorder']}{sample_format}{bits // 8}")
+
+        # strips must be stored back to back for the whole raster to be one memory map
+        offsets, counts = tags[273], tags[279]
+        for i in range(len(offsets) - 1):
+            if offsets[i] + counts[i] != offsets[i + 1]:
+                raise ValueError(f"{filepath} has non-contiguous strips and cannot be memory-mapped")
+        grid = np.memmap(filepath, dtype=dtype, mode="r", offset=offsets[0], shape=(nrows, ncols))
+
+        # georeferencing: pixel scale + tiepoint
+        sx, sy = tags[33550][0], tags[33550][1]
+        ti, tj, _, tx, ty, _ = tags[33922][:6]
+        geokeys = _parse_geokeys(tags.get(34735))
+        xmin, ymax = tx - ti * sx, ty + tj * sy
+        if geokeys.get(1025) == 2:
+            # RasterPixelIsPoint: the tiepoint refers to the cell centre rather than its corner
+            xmin, ymax = xmin - sx / 2, ymax + sy / 2
+
+        if crs is None:
+            epsg = geokeys.get(3072) or geokeys.get(2048)
+            crs = f"EPSG:{epsg}" if epsg and epsg != 32767 else PCS
+
+        nodata = float(tags[42113].strip("\x00 ")) if 42113 in tags else None
+        return cls(grid, xmin, ymax, sx, sy, nodata, crs)
+
+
+def _grid_cache_path(filepath, cache_dir) -> str:
+    """Returns the .npy file caching the parsed grid of 'filepath' in 'cache_dir'. The name is keyed by the absolute path
+    and the modification time of the file, so an edited grid is parsed again."""
+    path = os.path.abspath(filepath)
+    path_key = hashlib.sha256(path.encode()).hexdigest()[:16]
+    version_key = hashlib.sha256(f"{path}|{os.stat(path).st_mtime_ns}".encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{path_key}-{version_key}.npy")
+
+
+def _store_grid(cache, grid) -> bool:
+    """Writes a parsed grid to its cache file, replacing the caches of older versions of the same file.
+    Returns False, leaving no file behind, if the cache directory cannot be written."""
+    path_key = os.path.basename(cache).split("-")[0]
+    tmp = f"{cache}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        with open(tmp, "wb") as f:
+            np.save(f, grid)
+        os.replace(tmp, cache)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+    for stale in glob.glob(os.path.join(os.path.dirname(cache), f"{path_key}-*.npy")):
+        if stale != cache:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+    return True
+
+
+class DEMElevation:
+    """
+    Elevation provider backed by one or more local DEM tiles.
+    All points of a request are transformed and sampled in a single vectorized pass per tile.
+    """
+
+    def __init__(self, tiles, crs=None):
+        """
+        tiles:  a list of DEMTile objects or paths to .tif / .asc files (or a directory containing them)
+        crs:    CRS of the tiles, if it can't be read from the files themselves
+        """
+        if isinstance(tiles, str):
+            tiles = [tiles]
+        self.tiles = []
+        for tile in tiles:
+            if isinstance(tile, DEMTile):
+                self.tiles.append(tile)
+            elif os.path.isdir(tile):
+                for name in sorted(os.listdir(tile)):
+                    if os.path.splitext(name)[1].lower() in (".tif", ".tiff", ".asc"):
+                        self.tiles.append(DEMTile.from_file(os.path.join(tile, name), crs))
+            else:
+                self.tiles.append(DEMTile.from_file(tile, crs))
+        if not self.tiles:
+            raise ValueError("No DEM tiles were found")
+
+    def elevations(self, coords) -> np.ndarray:
+        """Returns the elevation (m) at every coordinate as a float64 array
+
+        coords: a list of (x, y) coordinates or an (N, 2) array, in EPSG:3857 (meters)
+        """
+        xy = as_coord_array(coords)
+        elevation = np.full(len(xy), np.nan)
+        pending = np.ones(len(xy), dtype=bool)
+
+        projected = {}
+        for tile in self.tiles:
+            if not pending.any():
+                break
+            if tile.crs not in projected:
+                projected[tile.crs] = transform_coords(xy, PCS, tile.crs)
+            tile_xy = projected[tile.crs]
+            mask = pending & tile.contains(tile_xy)
+            if mask.any():
+                elevation[mask] = tile.sample(tile_xy[mask])
+                # cells with nodata may still be covered by an overlapping tile
+                pending[mask] = np.isnan(elevation[mask])
+
+        if pending.any():
+            raise ValueError(f"The DEM tiles don't have elevation data at {int(pending.sum())} of {len(xy)} points. "
+                             "Please check the tile coverage of the field.")
+        return elevation
+
+
+class RemoteElevation:
+    """
+    Elevation provider backed by a remote point-query service (USGS EPQS compatible).
+
+    Coordinates are quantized to a 'precision' meter grid. Each distinct grid cell is requested at most once per call
+    and at most once ever while the on-disk cache is kept. Requests run over one pooled session on a bounded
+    thread pool, and failed requests (connection errors, 429 and 5xx responses) are retried with exponential backoff.
+    """
+
+    def __init__(self, url=USGS_EPQS_URL, cache_path=ELEVATION_CACHE_PATH, precision=1.0, max_workers=8,
+                 max_retries=4, backoff=0.5, timeout=10, session=None):
+        """
+        url:            endpoint of the elevation service. Queried with ?x=&y=&wkid=102100&units=Meters&output=json
+        cache_path:     path of the sqlite file caching elevations across runs. None disables the disk cache.
+        precision:      size (m) of the grid coordinates are quantized to, for caching and de-duplication
+        max_workers:    maximum number of concurrent requests
+        max_retries:    number of retries of a failed request before giving up
+        backoff:        initial retry delay (s), doubled after every attempt
+        timeout:        timeout of a single request (s)
+        session:        the requests.Session to query the service with, e.g. one with extra headers or a stub transport.
+                        None creates a pooled session of max_workers connections.
+        """
+        self.url = url
+        self.cache_path = cache_path
+        self.precision = precision
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+
+        self._lock = threading.Lock()
+        self._memory = {}
+        if cache_path:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            with closing(self._connect()) as db, db:
+                db.execute("CREATE TABLE IF NOT EXISTS elevation "
+                           "(url TEXT, precision REAL, qx INTEGER, qy INTEGER, value REAL, "
+                           "PRIMARY KEY (url, precision, qx, qy))")
+
+    def elevations(self, coords) -> np.ndarray:
+        """Returns the elevation (m) at every coordinate as a float64 array
+
+        coords: a list of (x, y) coordinates or an (N, 2) array, in EPSG:3857 (meters)
+        """
+        xy = as_coord_array(coords)
+        if len(xy) == 0:
+            return np.empty(0)
+
+        # de-duplicate on the quantized grid
+        quantized = np.round(xy / self.precision).astype(np.int64)
+        keys, inverse = np.unique(quantized, axis=0, return_inverse=True)
+        keys = [tuple(k) for k in keys.tolist()]
+
+        values = self._cache_lookup(keys)
+        missing = [k for k in keys if k not in values]
+        if missing:
+            print(f"Note: Requesting {len(missing)} of {len(keys)} elevation points from {self.url}")
+            fetched, failed = {}, {}
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {pool.submit(self._fetch, k): k for k in missing}
+                for future in futures:
+                    try:
+                        fetched[futures[future]] = future.result()
+                    except (ConnectionError, requests.RequestException) as e:
+                        failed[futures[future]] = e
+            # the points fetched are cached even if others failed, so a retry only requests the failed ones
+            self._cache_store(fetched)
+            if failed:
+                first = next(iter(failed.values()))
+                raise ConnectionError(f"{len(failed)} of {len(missing)} elevation requests failed, "
+                                      f"{len(fetched)} were cached. First error: {first}") from first
+            values.update(fetched)
+
+        return np.array([values[k] for k in keys], dtype=np.float64)[inverse.ravel()]
+
+    def _fetch(self, key) -> float:
+        """Requests the elevation at the centre of quantized grid cell 'key', retrying with exponential backoff"""
+        params = {
+            'output': 'json',
+            'x': key[0] * self.precision,
+            'y': key[1] * self.precision,
+            'wkid': 102100,
+            'units': 'Meters'
+        }
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.get(self.url, params=params, timeout=self.timeout)
+                if response.status_code != 429 and response.status_code < 500:
+                    response.raise_for_status()
+                    json_result = response.json()
+                    break
+                error = ConnectionError(f"Elevation service responded with status {response.status_code}")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt == self.max_retries:
+                raise ConnectionError(f"Elevation request failed after {self.max_retries + 1} attempts") from error
+            time.sleep(delay)
+            delay *= 2
+
+        #Parse the .json file format and extract the 'value', which is the elevation data
+        try:
+            return float(json_result['value'])
+        except (KeyError, TypeError, ValueError):
+            raise ConnectionError("The API doesn't have elevation data at this point. Please check the validity of the coordinate input.")
+
+    """
+    =============
+    === Cache ===
+    =============
+    """
+
+    def _connect(self):
+        return sqlite3.connect(self.cache_path, timeout=30)
+
+    def _cache_lookup(self, keys) -> dict:
+        """Returns the cached {key: elevation} entries among 'keys', from memory first and then from disk"""
+        with self._lock:
+            found = {k: self._memory[k] for k in keys if k in self._memory}
+        remaining = [k for k in keys if k not in found]
+        if self.cache_path and remaining:
+            with closing(self._connect()) as db, db:
+                db.execute("CREATE TEMP TABLE wanted (qx INTEGER, qy INTEGER)")
+                db.executemany("INSERT INTO wanted VALUES (?, ?)", remaining)
+                rows = db.execute("SELECT e.qx, e.qy, e.value FROM elevation e JOIN wanted w "
+                                  "ON e.qx = w.qx AND e.qy = w.qy WHERE e.url = ? AND e.precision = ?",
+                                  (self.url, self.precision)).fetchall()
+            disk = {(qx, qy): value for qx, qy, value in rows}
+            with self._lock:
+                self._memory.update(disk)
+            found.update(disk)
+        return found
+
+    def _cache_store(self, values):
+        """Stores {key: elevation} entries in memory and on disk"""
+        with self._lock:
+            self._memory.update(values)
+        if self.cache_path and values:
+            with closing(self._connect()) as db, db:
+                db.executemany("INSERT OR REPLACE INTO elevation VALUES (?, ?, ?, ?, ?)",
+                               [(self.url, self.precision, k[0], k[1], v) for k, v in values.items()])
+
+
+"""
+=======================
+=== GeoTIFF Parsing ===
+=======================
+"""
+
+# TIFF field type: (struct code, size in bytes)
+_TIFF_TYPES = {1: ("B", 1), 2: ("s", 1), 3: ("H", 2), 4: ("I", 4), 5: ("II", 8), 6: ("b", 1), 7: ("B", 1),
+               8: ("h", 2), 9: ("i", 4), 11: ("f", 4), 12: ("d", 8), 16: ("Q", 8), 17: ("q", 8)}
+
+
+def _read_tiff_tags(filepath) -> dict:
+    """Reads the tags of the first IFD of a (Big)TIFF file into a {tag: values} dictionary.
+    The byte order ('<' or '>') is stored under the key 'byteorder'.
+    """
+    with open(filepath, "rb") as f:
+        order = {b"II": "<", b"MM": ">"}.get(f.read(2))
+        if order is None:
+            raise ValueError(f"{filepath} is not a TIFF file")
+        version = struct.unpack(order + "H", f.read(2))[0]
+        if version == 42:
+            ifd_offset = struct.unpack(order + "I", f.read(4))[0]
+            count_fmt, entry_fmt, inline_size = "H", "HHI", 4
+        elif version == 43:
+            f.read(4)
+            ifd_offset = struct.unpack(order + "Q", f.read(8))[0]
+            count_fmt, entry_fmt, inline_size = "Q", "HHQ", 8
+        else:
+            raise ValueError(f"{filepath} is not a TIFF file")
+
+        f.seek(ifd_offset)
+        num_entries = struct.unpack(order + count_fmt, f.read(struct.calcsize(count_fmt)))[0]
+        entries = [struct.unpack(order + entry_fmt, f.read(struct.calcsize(entry_fmt)))
+                   + (f.read(inline_size),) for _ in range(num_entries)]
+
+        tags = {"byteorder": order}
+        for tag, ftype, count, raw in entries:
+            code, size = _TIFF_TYPES[ftype]
+            nbytes = size * count
+            if nbytes > inline_size:
+                f.seek(struct.unpack(order + ("I" if inline_size == 4 else "Q"), raw)[0])
+                raw = f.read(nbytes)
+            if ftype == 2:
+                tags[tag] = raw[:nbytes].decode("ascii", errors="ignore")
+            elif ftype == 5:
+                values = struct.unpack(order + "I" * 2 * count, raw[:nbytes])
+                tags[tag] = [values[i] / values[i + 1] for i in range(0, len(values), 2)]
+            else:
+                tags[tag] = list(struct.unpack(order + code * count, raw[:nbytes]))
+    return tags
+
+
+def _parse_geokeys(directory) -> dict:
+    """Returns the inline (SHORT) GeoKeys of a GeoKeyDirectoryTag as a {key: value} dictionary"""
+    if not directory:
+        return {}
+    keys = {}
+    for i in range(directory[3]):
+        key, location, _, value = directory[4 + 4 * i: 8 + 4 * i]
+        if location == 0:
+            keys[key] = value
+    return keys
@@ -80,12 +80,13 @@ def showprojection(ax, full_path):
             ax.plot(x1, y1, 0, color="firebrick", linestyle=":", alpha=0.4)
 
 
-def show3Dpath(full_path, height_offset=0, plottype="coarse", gif=False):
+def show3Dpath(full_path, height_offset=0, plottype="coarse", gif=False, elevation_provider=None):
     """
     Plots the complete 3D path.
 
     full_path: a Path object. The .path attribute extracts the list of LineString that makes the Path object.
     plottype: 'dense' or 'coarse'
+    elevation_provider: an elevation provider (e.g. elevation.DEMElevation) used instead of the path's own
     """
     disp_color = "forestgreen"
     nondisp_color = "darkgoldenrod"
@@ -98,14 +99,20 @@ def show3Dpath(full_path, height_offset=0, plottype="coarse", gif=False):
         reference_line = full_path.path
         reference_coords = full_path.coords
         dispersion_map = full_path.disp_map
-        elevation = full_path.critical_elevations
     elif plottype == 'dense':
         reference_line = full_path.waypoints_path
         reference_coords = full_path.waypoints
         dispersion_map = full_path.waypoints_disp_map
-        elevation = full_path.waypoint_elevations
     else:
-        raise ValueError(f"There isn't enough z-values to plot for the path. There are {len(full_path.coords)} points in path and only {len(elevation)} z-values.")
+        raise ValueError(f"Unknown plottype '{plottype}'. Use 'coarse' or 'dense'")
+    
+    # The path's own elevations are only looked up (possibly remotely) when no provider is given
+    if elevation_provider is not None:
+        elevation = get_elevation([(pt.x, pt.y) for pt in reference_coords], elevation_provider)
+    elif plottype == 'coarse':
+        elevation = full_path.critical_elevations
+    else:
+        elevation = full_path.waypoint_elevations
     
     label_helper_disp = False  # Create tracking variable so only 1 label appears on legend
     label_helper_nondisp = False
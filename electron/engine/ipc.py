@@ -0,0 +1,147 @@
+# src/ipc.py
+
+import json
+import struct
+import numpy as np
+import shapely
+import geopandas as gpd
+
+"""
+=========================
+=== Binary IPC Frames ===
+=========================
+
+Description of the messages exchanged by the GUI and the engine daemon (see daemon.py).
+
+#TL:DR
+A frame is an 8-byte header of two big-endian uint32, the size of a JSON part and the size of a binary payload,
+followed by the JSON part and the payload. Coordinate arrays never go through JSON: every NumPy array of a message
+is packed as little-endian float64 into the payload, and replaced in the JSON part by a placeholder
+{"$array": shape, "offset": byte offset in the payload}. The JSON part is padded with spaces so the payload starts
+on an 8-byte boundary of the frame.
+A frame is read with a single readinto() into one buffer, and its arrays are NumPy views of that buffer
+(np.frombuffer), so they are never copied. Arrays are written straight from their memory with memoryview.
+Writing the planned paths to files (best_path.shp and projected_coordinates.json) is left to export_paths().
+"""
+
+# Sizes of the JSON part and of the binary payload of a frame, as big-endian uint32
+FRAME_HEADER = struct.Struct(">II")
+# Frames above this size are rejected, so a corrupted header cannot make the reader allocate gigabytes
+MAX_FRAME_SIZE = 1024 * 2**20
+# Arrays travel as packed little-endian float64
+ARRAY_DTYPE = np.dtype('<f8')
+ARRAY_KEY = "$array"
+
+
+def encode_message(message):
+    """Encodes 'message' into the parts of a frame. Returns (header, JSON part, list of array buffers).
+
+    message: anything JSON can encode, where NumPy arrays (of any numeric dtype) may appear anywhere
+    """
+    buffers = []
+    offset = 0
+
+    def placeholder(value):
+        nonlocal offset
+        if isinstance(value, np.ndarray):
+            if value.dtype.kind not in "biuf":
+                raise TypeError(f"Cannot send an array of dtype {value.dtype}")
+            array = np.ascontiguousarray(value, dtype=ARRAY_DTYPE)
+            buffers.append(memoryview(array).cast('B'))
+            ref = {ARRAY_KEY: list(array.shape), 'offset': offset}
+            offset += array.nbytes
+            return ref
+        if isinstance(value, np.generic):
+            return value.item()
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    body = json.dumps(message, separators=(',', ':'), default=placeholder).encode()
+    # pad the JSON part so the payload is 8-byte aligned within the frame
+    body += b" " * (-(FRAME_HEADER.size + len(body)) % ARRAY_DTYPE.itemsize)
+    return FRAME_HEADER.pack(len(body), offset), body, buffers
+
+
+def decode_message(frame, json_size):
+    """Decodes a frame read into 'frame' (without its header). Arrays are returned as views of 'frame', not copies.
+
+    frame:      bytearray (or any writable buffer) of the JSON part followed by the payload
+    json_size:  size of the JSON part
+    """
+    view = memoryview(frame)
+
+    def array(obj):
+        if ARRAY_KEY in obj:
+            shape = tuple(obj[ARRAY_KEY])
+            count = int(np.prod(shape, dtype=np.int64))
+            values = np.frombuffer(frame, dtype=ARRAY_DTYPE, count=count, offset=json_size + obj['offset'])
+            return values.reshape(shape)
+        return obj
+
+    return json.loads(view[:json_size].tobytes(), object_hook=array)
+
+
+def read_message(stream):
+    """Reads one frame from the binary 'stream'. Returns its decoded message, or None at the end of the stream.
+    Raises EOFError if the stream ends in the middle of a frame.
+    """
+    header = bytearray(FRAME_HEADER.size)
+    if not _read_into(stream, memoryview(header)):
+        return None
+    json_size, payload_size = FRAME_HEADER.unpack(header)
+    if json_size + payload_size > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {json_size + payload_size} bytes exceeds the maximum of {MAX_FRAME_SIZE} bytes")
+    frame = bytearray(json_size + payload_size)
+    if frame and not _read_into(stream, memoryview(frame)):
+        raise EOFError("Stream ended in the middle of a frame")
+    return decode_message(frame, json_size)
+
+
+def write_message(stream, message):
+    """Writes 'message' as one frame to the binary 'stream' and flushes it. Arrays are written from their own memory."""
+    header, body, buffers = encode_message(message)
+    stream.write(header + body)
+    for buffer in buffers:
+        stream.write(buffer)
+    stream.flush()
+
+
+def _read_into(stream, view) -> bool:
+    """Fills 'view' from 'stream'. Returns False if the stream ends before the first byte."""
+    filled = 0
+    while filled < len(view):
+        count = stream.readinto(view[filled:])
+        if not count:
+            if filled:
+                raise EOFError("Stream ended in the middle of a frame")
+            return False
+        filled += count
+    return True
+
+
+"""
+==============
+=== Export ===
+==============
+"""
+def export_paths(paths, shape_path=None, json_path=None):
+    """Writes planned paths to the files the GUI used to read them from. Both files are optional.
+
+    paths:      list of (N, 2) vertex arrays, one path per polygon, in EPSG:3857
+    shape_path: shapefile of every line of every path, with the index of its path in the 'polygon' column
+    json_path:  JSON file of the lines of every path, as the start and end coordinates of Path.to_coordinates()
+    """
+    paths = [np.asarray(vertices, dtype=np.float64) for vertices in paths]
+    if shape_path is not None:
+        starts = np.concatenate([vertices[:-1] for vertices in paths])
+        ends = np.concatenate([vertices[1:] for vertices in paths])
+        polygon_index = np.repeat(np.arange(len(paths)), [len(vertices) - 1 for vertices in paths])
+        lines = shapely.linestrings(np.stack((starts, ends), axis=1))
+        gdf = gpd.GeoDataFrame({'polygon': polygon_index}, geometry=lines, crs="EPSG:3857")
+        gdf.to_file(shape_path)
+
+    if json_path is not None:
+        coordinates = [[{'start': {'x': start[0], 'y': start[1]}, 'end': {'x': end[0], 'y': end[1]}}
+                        for start, end in zip(vertices[:-1].tolist(), vertices[1:].tolist())]
+                       for vertices in paths]
+        with open(json_path, 'w') as jsonfile:
+            json.dump(coordinates, jsonfile)
@@ -3,36 +3,61 @@
 # import matplotlib
 # import matplotlib.pyplot as plt
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from .optimization import *
 from .basic_functions import *
+from .plan_cache import PlanCache, plan_key, field_key, drone_parameters
+from .ipc import export_paths
 import json
 
 # STATIC_DIR = os.path.join(os.path.dirname(
 #     os.path.abspath(__file__)), 'static')
 DATA_DIR = os.path.join(os.path.dirname(
     os.path.abspath(__file__)), 'gui', 'assets', 'data')
-JSON_FILE_PATH = os.path.join(DATA_DIR, 'polygons.json')
 SHAPE_FILE_PATH = os.path.join(DATA_DIR, "best_path.shp")
-PROJECTED_COORDS_JSON_PATH = os.path.join(
-    DATA_DIR, 'projected_coordinates.json')
 
 # Ensure the data directory exists
 os.makedirs(DATA_DIR, exist_ok=True)
 
+_plan_cache = None
+
+
+def get_plan_cache():
+    """Returns the PlanCache shared by every optimize() call of this process, created on first use.
+    Its disk tier keeps plans across runs, so re-planning the same blocks with the same settings is immediate.
+    """
+    global _plan_cache
+    if _plan_cache is None:
+        _plan_cache = PlanCache()
+    return _plan_cache
+
 
-# also take polygon info from JSON_FILE_PATH
 # TODO: add more parameters
-def optimize(disp_diam: int):
+def optimize(disp_diam: int, polygons, time_budget=None, callback=None, use_cache=False, workers=1):
+    """Plans the best path of every polygon, e.g. of the list returned by upload_file()
+
+    disp_diam:      dispersion diameter of the drone
+    polygons:       list of the polygons to plan, each a list of (x, y) coordinates in EPSG:3857
+    time_budget:    wall-clock budget (s) of the whole run, shared evenly by the polygons.
+                    Each polygon returns the best path found within its share. None (default) evaluates every candidate.
+    callback:       called as callback(index, row, best) with the index of a polygon, the [Path, airtime, seeding efficiency,
+                    spilled area] row of a candidate and the best Path so far of that polygon. Planned serially, it is
+                    called as soon as every candidate is evaluated, so the GUI can draw a path early and refine it.
+                    Planned in parallel, it is called once per polygon with its best path, as soon as the polygon is done.
+    use_cache:      reads and stores the plans in the shared PlanCache (see get_plan_cache()), whose disk tier is
+                    plan_cache.PLAN_CACHE_PATH. The best path of a polygon is only stored when all of its candidates
+                    were evaluated, i.e. without time budget. False (default) plans everything and writes no cache file.
+    workers:        number of processes planning polygons concurrently, one polygon per process.
+                    1 (default) plans the polygons one after another in this process, None uses every core.
+    """
+    start_time = time.time()
     debug_info = []
     debug_info.append("Received a request to /optimize")
 
-    # Use the JSON file generated by mapHandler.js
-    if os.path.exists(JSON_FILE_PATH):
-        file_path = JSON_FILE_PATH
-        debug_info.append(f"Using generated JSON file: {file_path}")
-    else:
-        debug_info.append("No generated JSON file found")
-        return  # 'error': 'No generated JSON file found', 'debug': debug_info
+    if not polygons:
+        debug_info.append("No polygon to plan")
+        return
 
     if not disp_diam:
         debug_info.append("Display diameter is required")
@@ -41,54 +66,114 @@ def optimize(disp_diam: int):
 
     debug_info.append(f"Display diameter received: {disp_diam}")
 
-    # Extract coords from the uploaded JSON file
-    with open(file_path, 'r') as json_file:
-        coordinate_info = json.load(json_file)
-
-    all_projected_coords = []
-    bestPathList = []
+    coordinate_info = polygons
+    num_polygons = len(coordinate_info)
+    workers = min(num_polygons, (os.cpu_count() or 1) if workers is None else workers)
+    cache = get_plan_cache() if use_cache else None
+    best_paths = [None] * num_polygons
+
+    if workers <= 1:
+        # Iterate through each polygon in the coordinate info
+        for index, polygon in enumerate(coordinate_info):
+            # Share what is left of the time budget between the remaining polygons
+            budget = None
+            if time_budget is not None:
+                budget = max(0, time_budget - (time.time() - start_time)) / (num_polygons - index)
+            progress = None
+            if callback is not None:
+                def progress(row, best, index=index):
+                    callback(index, row, best)
+            best_paths[index], messages = plan_polygon(polygon, disp_diam, budget, cache, progress)
+            debug_info.extend(messages)
+    else:
+        # Every process plans whole polygons, `workers` of them at a time
+        budget = None if time_budget is None else time_budget * workers / num_polygons
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_plan_polygon_job, (polygon, disp_diam, budget, use_cache)): index
+                       for index, polygon in enumerate(coordinate_info)}
+            for future in as_completed(futures):
+                index = futures[future]
+                result, messages = future.result()
+                best_paths[index] = restore_path(coordinate_info[index], disp_diam, result, cache)
+                debug_info.extend(messages)
+                if callback is not None:
+                    best = best_paths[index]
+                    callback(index, [best, best.airtime, best.seeding_coverage_efficiency, best.spilled_area], best)
+
+    # Assuming best_path.to_coordinates() returns coordinates in EPSG:3857
+    all_projected_coords = [best_path.to_coordinates() for best_path in best_paths]
+
+    # # Save the plot to a file in the static directory
+    # plot_filename = f'best_path_{time.time()}.png'
+    # plot_path = os.path.join(STATIC_DIR, plot_filename)
+    # plt.figure(figsize=(16, 8))
+    # showpath(best_path)
+    # plt.savefig(plot_path)
+    # plt.close()
+    # debug_info.append(f"Saved plot to {plot_path}")
+
+    # Shapefile extraction, the lines of every polygon's best path written at once
+    export_paths([best_path.vertices for best_path in best_paths], shape_path=SHAPE_FILE_PATH)
+
+    # The projected coordinates are returned to the caller rather than left in a JSON file
+    return all_projected_coords, debug_info
 
-    # Iterate through each polygon in the coordinate info
-    for polygon in coordinate_info:
-        debug_info.append(f"Extracted coordinates from JSON: {polygon}")
 
-        # Construct the best path and measure runtime
-        optimal_func = airtime_coverage_weighted(75, 15, 10)
+def plan_polygon(polygon, disp_diam, time_budget=None, cache=None, callback=None):
+    """Plans the best path of one polygon. Returns the best Path and the debug messages of the planning.
+
+    polygon:        list of (x, y) coordinates of the polygon, in EPSG:3857
+    time_budget:    wall-clock budget (s) of the search, None evaluates every candidate
+    cache:          a PlanCache, see optimize()
+    callback:       called as callback(row, best) as soon as every candidate is evaluated, see construct_pathlist()
+    """
+    debug_info = [f"Planning polygon: {polygon}"]
+
+    # Construct the best path and measure runtime
+    weights = (75, 15, 10)
+    optimal_func = airtime_coverage_weighted(*weights)
+    best_key = cached = None
+    if cache is not None:
+        best_key = plan_key('best', field_key(polygon, disp_diam, None, 0), disp_diam, -10, 10, 10, weights, drone_parameters())
+        cached = cache.get(best_key)
+    if cached is not None:
+        # Rebuild the best path found by an earlier run, with its metrics
+        best_path = restore_path(polygon, disp_diam, cached, cache)
+        if callback is not None:
+            callback([best_path, best_path.airtime, best_path.seeding_coverage_efficiency, best_path.spilled_area], best_path)
+        debug_info.append(f"Found cached best path: {best_path}")
+    else:
         pathlist, pathlistruntime = construct_pathlist(
-            polygon, disp_diam, children=None, poly_offset=0, num_path=10)  # calculates the optimized path
+            polygon, disp_diam, children=None, poly_offset=0, num_path=10,
+            optimizer=optimal_func, time_budget=time_budget, callback=callback, cache=cache)  # calculates the optimized path
         datatable, best_path = find_best_path(pathlist, optimal_func)
         debug_info.append(f"Constructed best path: {best_path}")
+        if best_key is not None and time_budget is None:
+            cache.put(best_key, path_result(best_path))
+    return best_path, debug_info
 
-        # Assuming best_path.to_coordinates() returns coordinates in EPSG:3857
-        bestPathList.append(best_path.path)
-        projected_coords = best_path.to_coordinates()
-        all_projected_coords.append(projected_coords)
 
-        # # Save the plot to a file in the static directory
-        # plot_filename = f'best_path_{time.time()}.png'
-        # plot_path = os.path.join(STATIC_DIR, plot_filename)
-        # plt.figure(figsize=(16, 8))
-        # showpath(best_path)
-        # plt.savefig(plot_path)
-        # plt.close()
-        # debug_info.append(f"Saved plot to {plot_path}")
+def path_result(path) -> tuple:
+    """Returns the (vertices, swath slope, airtime, coverage metrics) a planned Path is stored and sent as"""
+    return path.vertices, path.swath_slope, path.airtime, path.coverage_metrics
 
-        # Shapefile extraction
 
-        gdf = gpd.GeoDataFrame(geometry=bestPathList[0])
-        gdf.set_crs(epsg=3857, inplace=True)
-        gdf.to_file(SHAPE_FILE_PATH)
+def restore_path(polygon, disp_diam, result, cache=None):
+    """Rebuilds the Path of a (vertices, swath slope, airtime, coverage metrics) result of plan_polygon(),
+    with its metrics, on the offset outline of 'polygon'"""
+    vertices, swath_slope, airtime, metrics = result
+    key = field_key(polygon, disp_diam, None, 0) if cache is not None else None
+    offset_outline, _, _ = prepare_field(polygon, disp_diam, None, 0, cache=cache, key=key)
+    path = Path(vertices, offset_outline, disp_diam, swath_slope)
+    path.__dict__.update(airtime=airtime, coverage_metrics=metrics)
+    return path
 
-    # Save projected coordinates to a new JSON file
-    try:
-        with open(PROJECTED_COORDS_JSON_PATH, 'w') as jsonfile:
-            json.dump(all_projected_coords, jsonfile)
-            debug_info.append(
-                f"Saved projected coordinates to {PROJECTED_COORDS_JSON_PATH}")
-    except Exception as e:
-        debug_info.append(f"Error saving projected coordinates: {str(e)}")
 
-    return all_projected_coords, debug_info
+def _plan_polygon_job(job):
+    """Plans one polygon in a worker process of optimize(). Returns its path_result() and the debug messages"""
+    polygon, disp_diam, time_budget, use_cache = job
+    best_path, debug_info = plan_polygon(polygon, disp_diam, time_budget, get_plan_cache() if use_cache else None)
+    return path_result(best_path), debug_info
 
 
 def generate_polygons(data):
@@ -98,12 +183,11 @@ def generate_polygons(data):
 
 
 def upload_file(shp_path):
+    """Returns the polygons of a shapefile, to pass on to optimize(), or None if it cannot be read"""
     try:
         polygonString, polygonList = generate_polygons(shp_path)
 
     except Exception as e:
         return
 
-    with open(os.path.join(os.path.dirname(__file__), 'data', 'polygons.json'), 'w') as f:
-        f.write(polygonString)
-    return  # jsonify(success=True)
+    return polygonList
@@ -2,8 +2,16 @@
 from outline import *
 from graph import *
 from basic_functions import *
+from tiling import swath_tiles, tile_metrics, merge_metrics
+from coverage import coverage_bounds
+from plan_cache import plan_key, field_key, drone_parameters
+import os
 import time
+import signal
+import multiprocessing
 import pandas as pd
+from scipy.optimize import minimize_scalar
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 """
 =====================
@@ -13,39 +21,281 @@ import pandas as pd
 An aggregation of functions to find optimal Path instance given relevant weighting parameters.
 """
 
-def construct_pathlist(coords, disp_diam, children=None, poly_offset=None, init_slope=-10, end_slope=10, num_path=10):
+def construct_pathlist(coords, disp_diam, children=None, poly_offset=None, init_slope=-10, end_slope=10, num_path=10, workers=1,
+                       search="grid", optimizer=None, max_refine=None, coverage="exact", cell_size=None,
+                       reverse=False, tile_swaths=None, simplify=None, prune=False, time_budget=None, callback=None,
+                       cache=None):
+    """Constructs candidate paths and evaluates their airtime, seeding efficiency and spilled area.
+    Returns a DataFrame of the candidates (in a deterministic order) and the runtime.
+
+    workers:    number of processes evaluating candidates. 1 (default) evaluates them serially in this process,
+                None uses every core. Results are identical and in the same order either way.
+    search:     "grid" evaluates num_path slopes evenly spaced between init_slope and end_slope, plus "vertical".
+                "angle" evaluates max(3, (num_path + 1) // 2) baseline angles evenly spaced over [0, 180) degrees,
+                then refines the best one with a bounded Brent search on the composite score of 'optimizer'.
+                It evaluates fewer candidates than the "grid" search from num_path 4 up (e.g. at most 15 instead of 22).
+    optimizer:  the optimizer later passed to find_best_path(), e.g. airtime_coverage_weighted(75, 15, 10).
+                Required by the "angle" search.
+    max_refine: maximum number of refinement steps of the "angle" search, its number of coarse angles by default
+    coverage:   "exact" (default) computes coverage and spill with polygon operations.
+                "raster" estimates them by counting cells of a grid, which is faster on large fields. The DataFrame
+                then also reports the estimated absolute errors in 'Seeding_Efficiency_Error' and 'Spill_Area_Error'.
+    cell_size:  cell size (m) of the "raster" coverage grid, half of disp_diam by default
+    reverse:    also evaluates every candidate flown backwards, starting from the other end.
+                Reversed candidates share the coverage of their forward path, so they only cost their airtime.
+    tile_swaths: plans very large fields in strips of this many swath lines (e.g. tiling.DEFAULT_TILE_SWATHS).
+                Every candidate is still one continuous path, but its coverage is computed strip by strip, with the
+                strips spread over the workers, so memory is bounded by the strip size. None (default) plans whole paths.
+    simplify:   simplifies the field and its children before planning, with a tolerance of simplify * disp_diam
+                (e.g. 0.05), see simplify_field(). The report of the change is stored in df.attrs['simplification'].
+                None (default) plans the field as given.
+    prune:      skips the coverage of the "grid" candidates that cannot be the best path under 'optimizer' (branch and bound,
+                see CandidateEvaluator.evaluate_pruned). Pruned candidates are left out of the DataFrame, and their number
+                is stored in df.attrs['pruned']. Requires 'optimizer'.
+    time_budget: wall-clock budget (s) of the "grid" search. Slopes are then evaluated from coarse to fine, and only the
+                candidates evaluated when the budget runs out are returned (at least those of one slope).
+                None (default) evaluates every candidate.
+    callback:   called as callback(row, best) as soon as every "grid" candidate is evaluated, with its
+                [Path, airtime, seeding efficiency, spilled area] row and the best Path so far under 'optimizer'
+                (None without optimizer). See stream_pathlist() for the generator version.
+    cache:      a PlanCache. The offset outline of the field, the swath lines of every slope and the results of every
+                candidate are then read from it when the same field is planned again with the same settings,
+                and stored in it otherwise. None (default) computes everything.
+    """
     #Start Runtime Calc
     start_time = time.time()
-    
-    if isinstance(children, Outline):
-        children = [children]
-    
-    if poly_offset is None:
-        poly_offset = disp_diam / 2
-    
-    outline = Outline('BasePoly', coords, children)
-    offset_outline = outline.poly_offset(poly_offset)
-    
-    pathdata = []
-    for invert in [False, True]:
-        for slope in [x for x in np.linspace(init_slope, end_slope, num_path)] + ["vertical"]:
-            path = offset_outline.swath_gen(disp_diam, slope, invert)
-            data = [path, path.airtime, path.seeding_coverage_efficiency, path.spilled_area]
-            pathdata.append(data)
+    deadline = None if time_budget is None else start_time + time_budget
+    streaming = time_budget is not None or callback is not None
+
+    if prune or streaming:
+        if search != "grid" or tile_swaths is not None:
+            raise ValueError("Pruning, time budgets and callbacks are only available for the 'grid' search on whole paths")
+        if prune and streaming:
+            raise ValueError("Pruning cannot be combined with a time budget or a callback")
+    if prune:
+        assert optimizer is not None, "pruning needs the optimizer to bound the score of candidates"
+
+    key = field_key(coords, disp_diam, children, poly_offset, simplify) if cache is not None else None
+    offset_outline, raster_grid, simplification = prepare_field(coords, disp_diam, children, poly_offset, coverage,
+                                                                cell_size, simplify, cache, key)
+
+    with CandidateEvaluator(offset_outline, disp_diam, workers, raster_grid, tile_swaths, cache, key) as evaluator:
+        if search == "grid":
+            candidates = grid_candidates(init_slope, end_slope, num_path, reverse)
+            if prune:
+                pathdata, pruned = evaluator.evaluate_pruned(candidates, optimizer)
+            elif streaming:
+                rows = {}
+                for i, row, best in stream_candidates(evaluator, candidates, optimizer, deadline):
+                    rows[i] = row
+                    if callback is not None:
+                        callback(row, best)
+                pathdata = [rows[i] for i in sorted(rows)]
+            else:
+                pathdata = evaluator.evaluate(candidates)
+        elif search == "angle":
+            assert optimizer is not None, "the 'angle' search needs the optimizer to score candidates"
+            num_coarse = max(3, (num_path + 1) // 2)
+            pathdata = angle_search(evaluator, optimizer, num_coarse, num_coarse if max_refine is None else max_refine,
+                                    direction_variants(reverse))
+        else:
+            raise ValueError(f"Unknown search '{search}'. Use 'grid' or 'angle'")
     df = pd.DataFrame(pathdata, columns=['Path', 'Airtime', 'Seeding_Efficiency', 'Spill_Area'])
+    if raster_grid is not None:
+        df['Seeding_Efficiency_Error'] = [path.seeding_coverage_efficiency_error for path in df['Path']]
+        df['Spill_Area_Error'] = [path.spilled_area_error for path in df['Path']]
+    if simplification is not None:
+        df.attrs['simplification'] = simplification
+    if prune:
+        df.attrs['pruned'] = pruned
     end_time = time.time()
     runtime = end_time - start_time
     return df, runtime
 
+def stream_pathlist(coords, disp_diam, optimizer=None, children=None, poly_offset=None, init_slope=-10, end_slope=10,
+                    num_path=10, workers=1, coverage="exact", cell_size=None, reverse=False, simplify=None, time_budget=None,
+                    cache=None):
+    """Anytime version of the "grid" search of construct_pathlist(). A generator yielding (row, best) as soon as every
+    candidate is evaluated: its [Path, airtime, seeding efficiency, spilled area] row and the best Path so far under
+    'optimizer' (None without optimizer). Slopes are evaluated from coarse to fine (see coarse_to_fine()), so the first
+    paths already span the whole range of slopes and the following ones refine it.
+
+    time_budget: wall-clock budget (s). Once it runs out no further slope is started and the generator ends,
+                 after at least one slope. None (default) evaluates every candidate.
+    See construct_pathlist() for the other parameters.
+    """
+    deadline = None if time_budget is None else time.time() + time_budget
+    key = field_key(coords, disp_diam, children, poly_offset, simplify) if cache is not None else None
+    offset_outline, raster_grid, _ = prepare_field(coords, disp_diam, children, poly_offset, coverage, cell_size, simplify,
+                                                   cache, key)
+    with CandidateEvaluator(offset_outline, disp_diam, workers, raster_grid, cache=cache, cache_key=key) as evaluator:
+        candidates = grid_candidates(init_slope, end_slope, num_path, reverse)
+        for _, row, best in stream_candidates(evaluator, candidates, optimizer, deadline):
+            yield row, best
+
+def stream_candidates(evaluator, candidates, optimizer=None, deadline=None):
+    """Evaluates (slope, invert, reverse) candidates, slopes from coarse to fine, and yields (index, row, best) as soon as
+    every candidate is ready: its index in 'candidates', its [Path, airtime, seeding efficiency, spilled area] row and
+    the best Path so far under 'optimizer' (None without optimizer).
+
+    evaluator:  a CandidateEvaluator
+    deadline:   time.time() after which no further slope is started. The first slope is always evaluated.
+    """
+    slopes = list(dict.fromkeys(candidate[0] for candidate in candidates))
+    rank = {slopes[k]: r for r, k in enumerate(coarse_to_fine(len(slopes)))}
+    order = sorted(range(len(candidates)), key=lambda i: rank[candidates[i][0]])
+    rows = []
+    for j, row in evaluator.iter_evaluate([candidates[i] for i in order], deadline):
+        rows.append(row)
+        best = None
+        if optimizer is not None:
+            best = find_best_path(pd.DataFrame(rows, columns=['Path', 'Airtime', 'Seeding_Efficiency', 'Spill_Area']), optimizer)[1]
+        yield order[j], row, best
+
+def coarse_to_fine(n) -> list[int]:
+    """Orders the indices 0..n-1 of an evenly spaced range from coarse to fine: both ends, the middle,
+    then the middles of the halves, of the quarters, ... e.g. 9 -> [0, 8, 4, 2, 6, 1, 3, 5, 7]
+    """
+    order = [0, n - 1] if n > 1 else list(range(n))
+    intervals = [(0, n - 1)]
+    while intervals:
+        halves = []
+        for low, high in intervals:
+            if high - low > 1:
+                middle = (low + high) // 2
+                order.append(middle)
+                halves += [(low, middle), (middle, high)]
+        intervals = halves
+    return order
+
+def prepare_field(coords, disp_diam, children=None, poly_offset=None, coverage="exact", cell_size=None, simplify=None,
+                  cache=None, key=None):
+    """Builds the field planned by construct_pathlist(): its offset Outline, the RasterGrid of the "raster" coverage
+    (None for "exact") and the simplification report (None without simplify). See construct_pathlist() for the parameters.
+    With a PlanCache and the field_key() of the field, the offset outline and the report are cached under that key.
+    """
+    def offset_field(coords, children):
+        if isinstance(children, Outline):
+            children = [children]
+
+        simplification = None
+        if simplify is not None:
+            children_coords = [list(child.polygon.exterior.coords) for child in children] if children else []
+            coords, children_coords, simplification = simplify_field(coords, children_coords, simplify * disp_diam)
+            if children:
+                children = [Outline(child.name, points) for child, points in zip(children, children_coords)]
+
+        outline = Outline('BasePoly', coords, children)
+        return outline.poly_offset(disp_diam / 2 if poly_offset is None else poly_offset), simplification
+
+    if cache is not None and key is not None:
+        offset_outline, simplification = cache.get_or_compute(key, lambda: offset_field(coords, children))
+    else:
+        offset_outline, simplification = offset_field(coords, children)
+    outline = offset_outline.offsetparent
+
+    if coverage == "exact":
+        raster_grid = None
+    elif coverage == "raster":
+        cell_size = disp_diam / 2 if cell_size is None else cell_size
+        raster_grid = RasterGrid(outline, list(outline.children.values()), cell_size, margin=disp_diam / 2)
+    else:
+        raise ValueError(f"Unknown coverage '{coverage}'. Use 'exact' or 'raster'")
+    return offset_outline, raster_grid, simplification
+
+def direction_variants(reverse=False) -> list[tuple]:
+    """The (invert, reverse) direction variants evaluated for every slope. Reversed ones only if 'reverse'"""
+    variants = [(False, False), (True, False)]
+    if reverse:
+        variants += [(False, True), (True, True)]
+    return variants
+
+def grid_candidates(init_slope, end_slope, num_path, reverse=False) -> list[tuple]:
+    """The (slope, invert, reverse) candidates of the "grid" search: num_path slopes evenly spaced between init_slope
+    and end_slope, plus "vertical", in every direction variant"""
+    slopes = [x for x in np.linspace(init_slope, end_slope, num_path)] + ["vertical"]
+    return [(slope, invert, rev) for invert, rev in direction_variants(reverse) for slope in slopes]
+
+def angle_search(evaluator, optimizer, num_coarse=5, max_refine=6, variants=((False, False), (True, False))):
+    """Searches the baseline angle over [0, 180) degrees.
+    A coarse pass samples 'num_coarse' evenly spaced angles with every direction variant, an angle being scored by its
+    best variant. A bounded Brent search then refines the angle between the neighbours of the best coarse sample,
+    with the variant that won there only. Scores are min-max normalized with the ranges of the coarse pass.
+    At most num_coarse * len(variants) + max_refine candidates are evaluated.
+    Returns the data of every evaluated candidate, in evaluation order.
+
+    evaluator:  a CandidateEvaluator
+    optimizer:  the composite score function, e.g. airtime_coverage_weighted(75, 15, 10)
+    variants:   the (invert, reverse) direction variants evaluated at every coarse angle
+    """
+    pathdata = []
+    scores = {}
+
+    def evaluate_angles(angles, variants):
+        rows = evaluator.evaluate([(slope_from_angle(a), invert, rev) for a in angles for invert, rev in variants])
+        pathdata.extend(rows)
+        return rows
+
+    step = 180 / num_coarse
+    coarse_angles = [i * step for i in range(num_coarse)]
+    coarse = pd.DataFrame(evaluate_angles(coarse_angles, variants), columns=['Path', 'Airtime', 'Seeding_Efficiency', 'Spill_Area'])
+    ranges = {col: (coarse[col].min(), coarse[col].max()) for col in ['Airtime', 'Seeding_Efficiency', 'Spill_Area']}
+
+    def score(rows):
+        """Returns the best composite score of 'rows' and the index of the row reaching it"""
+        df = pd.DataFrame(rows, columns=['Path', 'Airtime', 'Seeding_Efficiency', 'Spill_Area'])
+        for col, (low, high) in ranges.items():
+            df[col] = (df[col] - low) / (high - low) if high > low else 0.0
+        optimizer(df)
+        return df['Composite_Score'].max(), int(df['Composite_Score'].to_numpy().argmax())
+
+    n = len(variants)
+    winners = {}
+    for i, angle in enumerate(coarse_angles):
+        scores[angle], winners[angle] = score(coarse.iloc[n * i: n * i + n].values.tolist())
+    best = max(scores, key=scores.get)
+    variant = variants[winners[best]]
+
+    def objective(angle):
+        key = angle % 180
+        if key not in scores:
+            scores[key], _ = score(evaluate_angles([key], [variant]))
+        return -scores[key]
+
+    minimize_scalar(objective, bounds=(best - step, best + step), method="bounded",
+                    options={"xatol": 0.5, "maxiter": max_refine})
+    return pathdata
+
+def slope_from_angle(angle):
+    """Converts a baseline angle (degrees, counter-clockwise from the x-axis) to the slope taken by swath_gen()"""
+    angle = angle % 180
+    if np.isclose(angle, 90):
+        return "vertical"
+    return float(np.tan(np.deg2rad(angle)))
+
+def optimizer_weights(optimizer) -> np.ndarray:
+    """Returns the weights of the normalized Airtime, Seeding_Efficiency and Spill_Area in the composite score of a
+    linear optimizer (e.g. airtime_coverage_weighted(75, 15, 10) gives [75, 15, -10]), by scoring unit rows.
+    """
+    columns = ['Airtime', 'Seeding_Efficiency', 'Spill_Area']
+    probe = pd.DataFrame(np.vstack((np.zeros(3), np.eye(3))), columns=columns)
+    optimizer(probe)
+    scores = probe['Composite_Score'].to_numpy()
+    return scores[1:] - scores[0]
+
 def find_best_path(pathdf, optimizer:tuple):
     """finds the best path based on optimizer, which is a function that returns an index given a path.
+    The metric columns are normalized in place. Their raw values are kept in pathdf.attrs['raw_metrics'] (see MetricTable).
     """
     def minmax_norm(col):
         """col is a DataFrame column"""
-        #Use Max-min normalization
-        col = (col - col.min()) / (col.max() - col.min())
+        #Use Max-min normalization. A constant column (e.g. a single candidate left after pruning) normalizes to 0
+        spread = col.max() - col.min()
+        col = (col - col.min()) / spread if spread > 0 else col * 0.0
         return col
     
+    if 'raw_metrics' not in pathdf.attrs:
+        pathdf.attrs['raw_metrics'] = pathdf[list(MetricTable.columns)].to_numpy(dtype=np.float64, copy=True)
     pathdf['Airtime'] = minmax_norm(pathdf['Airtime'])
     pathdf['Seeding_Efficiency'] = minmax_norm(pathdf['Seeding_Efficiency'])
     pathdf['Spill_Area'] = minmax_norm(pathdf['Spill_Area'])
@@ -68,4 +318,453 @@ def airtime_coverage_weighted(airtime_weight, seeding_weight, spill_weight):
     def func_constructor(pathdf):
         pathdf['Composite_Score'] = 100 * (pathdf.Airtime * airtime_weight + pathdf.Seeding_Efficiency * seeding_weight - pathdf.Spill_Area * spill_weight)
     return func_constructor
-    
+
+
+"""
+====================
+=== Metric Table ===
+====================
+"""
+class MetricTable:
+    """
+    MetricTable keeps the raw airtime, seeding efficiency and spilled area of evaluated candidates in one (N, 3) array,
+    normalized once, so they can be ranked again under any weighting without generating or evaluating any path.
+    """
+    columns = ('Airtime', 'Seeding_Efficiency', 'Spill_Area')
+
+    def __init__(self, pathdf):
+        """
+        pathdf: DataFrame of candidates from construct_pathlist(). A DataFrame already normalized by find_best_path()
+                is read from the raw values it kept in attrs['raw_metrics'].
+        """
+        self.paths = list(pathdf['Path'])
+        raw = pathdf.attrs.get('raw_metrics')
+        if raw is None:
+            raw = pathdf[list(self.columns)].to_numpy(dtype=np.float64)
+        self.metrics = np.array(raw, dtype=np.float64)    # (N, 3), raw values
+        # Max-min normalization of find_best_path(). A constant column normalizes to 0
+        low = self.metrics.min(axis=0)
+        spread = self.metrics.max(axis=0) - low
+        self.normalized = np.where(spread > 0, (self.metrics - low) / np.where(spread > 0, spread, 1), 0.0)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def scores(self, optimizer) -> np.ndarray:
+        """Returns the composite score of every candidate under 'optimizer', e.g. airtime_coverage_weighted(60, 30, 10).
+        Scores are the ones find_best_path() would give on the same candidates.
+        """
+        normalized = pd.DataFrame(self.normalized, columns=list(self.columns))
+        optimizer(normalized)
+        return normalized['Composite_Score'].to_numpy()
+
+    def rank(self, optimizer) -> np.ndarray:
+        """Returns the indices of the candidates from the best to the worst under 'optimizer'. Ties keep their order"""
+        return np.argsort(-self.scores(optimizer), kind='stable')
+
+    def best(self, optimizer):
+        """Returns the best Path under 'optimizer', the same one find_best_path() would pick"""
+        return self.paths[int(np.argmax(self.scores(optimizer)))]
+
+    def pareto_front(self, senses=(1, 1, -1)) -> np.ndarray:
+        """Returns the sorted indices of the candidates no other candidate dominates, i.e. is at least as good at every
+        metric and better at one. The best candidate under any positively weighted optimizer is on the front.
+
+        senses: +1 where a higher value of the metric is better, -1 where a lower one is.
+                The default follows the signs of airtime_coverage_weighted().
+        """
+        oriented = self.metrics * np.asarray(senses, dtype=np.float64)
+        # in decreasing lexicographic order, a candidate can only be dominated by one before it
+        order = np.lexsort((-oriented[:, 2], -oriented[:, 1], -oriented[:, 0]))
+        front = []
+        for i in order:
+            if front:
+                others = oriented[front]
+                if ((others >= oriented[i]).all(axis=1) & (others > oriented[i]).any(axis=1)).any():
+                    continue
+            front.append(i)
+        return np.sort(np.array(front, dtype=np.intp))
+
+    def frame(self, optimizer=None) -> pd.DataFrame:
+        """Returns the candidates with their raw metrics as a DataFrame, ranked under 'optimizer' if given,
+        with its 'Composite_Score' and a 'Pareto' flag of the candidates on the front
+        """
+        df = pd.DataFrame(self.metrics, columns=list(self.columns))
+        df.insert(0, 'Path', self.paths)
+        df['Pareto'] = False
+        df.loc[self.pareto_front(), 'Pareto'] = True
+        if optimizer is None:
+            return df
+        df['Composite_Score'] = self.scores(optimizer)
+        return df.iloc[self.rank(optimizer)]
+
+
+"""
+===========================
+=== Candidate Evaluator ===
+===========================
+"""
+class CandidateEvaluator:
+    """
+    Generates and evaluates candidate paths of one offset outline, either serially or on a process pool.
+    Use as a context manager so the pool is shut down once the search is done.
+    """
+
+    def __init__(self, offset_outline, disp_diam, workers=1, raster_grid=None, tile_swaths=None, cache=None, cache_key=None):
+        """
+        offset_outline: the Outline candidates are generated from
+        disp_diam:      dispersion diameter of the drone
+        workers:        number of worker processes. 1 evaluates serially, None uses every core.
+        raster_grid:    RasterGrid estimating the coverage of the candidates. None computes it exactly.
+        tile_swaths:    computes the exact coverage of every candidate in strips of this many swath lines,
+                        the strips being spread over the workers (see tiling.py). None computes it for the whole path.
+        cache:          PlanCache of the swath lines of every slope and the results of every candidate, reused by
+                        evaluate() and iter_evaluate(). None evaluates every candidate.
+        cache_key:      field_key() of the offset outline, which the cache keys of its slopes and candidates derive from
+        """
+        self.outline = offset_outline
+        self.disp_diam = disp_diam
+        self.raster_grid = raster_grid
+        self.tile_swaths = tile_swaths
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.pool = None
+        self._abandoned = False
+        self._worker_pids = None
+        self.cache = cache if cache_key is not None else None
+        self.cache_key = cache_key
+        self._drone = drone_parameters() if self.cache is not None else None
+
+    def __enter__(self):
+        if self.workers > 1:
+            # Each worker receives the offset outline once, and sends back only the path vertices and its metrics.
+            # It also reports its PID, so the pool can be stopped without waiting for abandoned slopes.
+            self._worker_pids = multiprocessing.SimpleQueue()
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                            initargs=(self.outline, self.disp_diam, self.raster_grid, self._worker_pids))
+        return self
+
+    def __exit__(self, *exc):
+        if self.pool is not None:
+            if self._abandoned:
+                # slopes still running past a deadline would only be thrown away, so their workers are stopped
+                # rather than waited for. Their futures fail with BrokenProcessPool, which nothing reads anymore.
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                while not self._worker_pids.empty():
+                    try:
+                        os.kill(self._worker_pids.get(), signal.SIGTERM)
+                    except ProcessLookupError:
+                        pass
+            else:
+                self.pool.shutdown()
+            self._worker_pids.close()
+            self.pool = None
+            self._worker_pids = None
+
+    @staticmethod
+    def group(candidates) -> dict:
+        """Groups (slope, invert) or (slope, invert, reverse) candidates by slope, in order of first appearance.
+        Returns {slope: [(index in candidates, (invert, reverse)), ...]}
+        """
+        groups = {}
+        for i, candidate in enumerate(candidates):
+            slope, invert, reverse = tuple(candidate) + (False,) * (3 - len(candidate))
+            groups.setdefault(slope, []).append((i, (invert, reverse)))
+        return groups
+
+    def evaluate(self, candidates) -> list[list]:
+        """Evaluates a list of (slope, invert) or (slope, invert, reverse) candidates.
+        Candidates sharing a slope are generated from a single set of swath lines (see Outline.swath_variants).
+        Returns [Path, airtime, seeding efficiency, spilled area] for every candidate, in the same order.
+        """
+        if self.tile_swaths is not None and self.raster_grid is None:
+            # group the candidates by slope, remembering their position
+            groups = self.group(candidates)
+            jobs = [(slope, [variant for _, variant in members]) for slope, members in groups.items()]
+            return self.evaluate_tiled(jobs, groups, len(candidates))
+
+        pathdata = [None] * len(candidates)
+        for i, row in self.iter_evaluate(candidates):
+            pathdata[i] = row
+        return pathdata
+
+    def iter_evaluate(self, candidates, deadline=None):
+        """Evaluates candidates like evaluate(), but yields (index, [Path, airtime, seeding efficiency, spilled area]) as
+        soon as every candidate is ready. Slopes are started in their order of first appearance in 'candidates';
+        on the pool, they are yielded in the order they complete.
+
+        deadline:   time.time() after which no further slope is started. Slopes still pending are abandoned,
+                    and the workers are stopped without finishing them when the evaluator exits.
+                    The first slope is always evaluated. None evaluates every candidate.
+        Slopes whose candidates are all in the cache are yielded first, without being generated again.
+        """
+        groups = {}
+        first = True
+        for slope, members in self.group(candidates).items():
+            results = self._cached_results(slope, members)
+            if results is None:
+                groups[slope] = members
+                continue
+            first = False
+            for (i, _), result in zip(members, results):
+                yield i, self._row(result)
+
+        if self.pool is None:
+            for slope, members in groups.items():
+                if not first and deadline is not None and time.time() > deadline:
+                    return
+                first = False
+                paths = _generate_paths(self.outline, self.disp_diam, self.raster_grid, slope,
+                                        [variant for _, variant in members], self._swath_data(slope))
+                self._store_results(slope, members, [(path.vertices, path.swath_slope, path.airtime, path.coverage_metrics)
+                                                     for path in paths])
+                for (i, _), path in zip(members, paths):
+                    yield i, [path, path.airtime, path.seeding_coverage_efficiency, path.spilled_area]
+            return
+
+        futures = {self.pool.submit(_evaluate_slope, (slope, [variant for _, variant in members], self._swath_data(slope))):
+                   (slope, members) for slope, members in groups.items()}
+        pending = set(futures)
+        try:
+            while pending:
+                timeout = None if first or deadline is None else max(0, deadline - time.time())
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                expired = not done
+                if expired:
+                    # keep the slopes that completed right at the deadline
+                    done = {future for future in pending if future.done()}
+                    pending -= done
+                first = False
+                for future in done:
+                    slope, members = futures[future]
+                    results = future.result()
+                    self._store_results(slope, members, results)
+                    for (i, _), result in zip(members, results):
+                        yield i, self._row(result)
+                if expired:
+                    break
+        finally:
+            # the workers of abandoned slopes are stopped when the evaluator exits
+            if pending:
+                self._abandoned = True
+
+    def _row(self, result) -> list:
+        """Returns the [Path, airtime, seeding efficiency, spilled area] row of an evaluated
+        (vertices, swath slope, airtime, coverage metrics) result"""
+        vertices, swath_slope, airtime, metrics = result
+        path = _rebuild_path(vertices, self.outline, self.disp_diam, self.raster_grid, swath_slope, airtime, metrics)
+        return [path, airtime, path.seeding_coverage_efficiency, path.spilled_area]
+
+    def _candidate_key(self, slope, variant) -> str:
+        """Cache key of the result of one (invert, reverse) variant of 'slope'"""
+        cell_size = None if self.raster_grid is None else self.raster_grid.cell_size
+        return plan_key('candidate', self.cache_key, self.disp_diam, slope, variant, cell_size, self._drone)
+
+    def _cached_results(self, slope, members):
+        """Returns the cached results of every member of a slope group, or None if any of them is missing"""
+        if self.cache is None:
+            return None
+        results = []
+        for _, variant in members:
+            result = self.cache.get(self._candidate_key(slope, variant))
+            if result is None:
+                return None
+            results.append(result)
+        return results
+
+    def _store_results(self, slope, members, results):
+        """Caches the (vertices, swath slope, airtime, coverage metrics) result of every member of a slope group"""
+        if self.cache is not None:
+            for (_, variant), result in zip(members, results):
+                self.cache.put(self._candidate_key(slope, variant), tuple(result))
+
+    def _swath_data(self, slope):
+        """Returns the swath lines of 'slope' (see Outline.swath_set) from the cache, computing them on a miss.
+        None without cache, in which case they are computed with the paths."""
+        if self.cache is None:
+            return None
+        key = plan_key('swath', self.cache_key, self.disp_diam, slope)
+        return self.cache.get_or_compute(key, lambda: self.outline.swath_set(self.disp_diam, slope))
+
+    def evaluate_pruned(self, candidates, optimizer) -> tuple[list[list], int]:
+        """Evaluates a list of (slope, invert) or (slope, invert, reverse) candidates with branch and bound.
+        Every candidate is generated and its airtime computed, which is cheap, while its seeding efficiency and spilled area
+        are only bounded from its length (see coverage_bounds). Exact coverage is then computed from the most promising
+        candidate down, and a candidate is pruned once an evaluated one outscores its best case under 'optimizer'.
+        The best case allows for any min-max normalization range the bounds leave possible, and never gains more than
+        the weight of a metric on it, so a pruned candidate cannot be the best path. Since airtime is known for every
+        candidate, its range is exact and candidates mostly get pruned on it, when airtime outweighs coverage.
+        Returns [Path, airtime, seeding efficiency, spilled area] of the evaluated candidates, in their original order,
+        and the number of pruned candidates.
+        """
+        weights = optimizer_weights(optimizer)
+        groups = self.group(candidates)
+        paths = [None] * len(candidates)
+        for slope, members in groups.items():
+            generated = _generate_paths(self.outline, self.disp_diam, self.raster_grid, slope, [variant for _, variant in members])
+            for (i, _), path in zip(members, generated):
+                paths[i] = path
+
+        # (airtime, seeding efficiency, spilled area) bounds of every candidate
+        outer_poly = self.outline.offsetparent if self.outline.offsetparent else self.outline
+        excluded_area = sum([child.polygon.area for child in outer_poly.children.values()])
+        desired_coverage = (outer_poly.polygon.area - excluded_area) / 1000**2
+        low, high = np.empty((len(paths), 3)), np.empty((len(paths), 3))
+        for k, path in enumerate(paths):
+            seeding, spill = coverage_bounds(path.pathlength * 1000, self.disp_diam, desired_coverage)
+            low[k] = path.airtime, seeding[0], spill[0]
+            high[k] = path.airtime, seeding[1], spill[1]
+        best_case = np.where(weights > 0, high, low)
+        # the normalization range of every metric is at most the envelope of the bounds,
+        # and at least the gap between the highest low bound and the lowest high bound
+        envelope = high.max(axis=0) - low.min(axis=0)
+        floor = np.maximum(low.max(axis=0) - high.min(axis=0), 0)
+        order = np.argsort(-(best_case / np.where(envelope > 0, envelope, 1)) @ weights, kind='stable')
+
+        exact = np.empty((len(paths), 3))
+        evaluated = np.zeros(len(paths), dtype=bool)
+        num_pruned = 0
+        pos = 0
+        while pos < len(order):
+            # next batch of candidates that can still win, one per worker
+            batch = []
+            while pos < len(order) and len(batch) < self.workers:
+                k = order[pos]
+                pos += 1
+                if _outscored(best_case[k], exact[evaluated], weights, floor, envelope):
+                    num_pruned += 1
+                else:
+                    batch.append(k)
+            self._compute_coverage([paths[k] for k in batch])
+            for k in batch:
+                exact[k] = paths[k].airtime, paths[k].seeding_coverage_efficiency, paths[k].spilled_area
+                evaluated[k] = True
+
+        pathdata = [[paths[k], *exact[k]] for k in np.flatnonzero(evaluated)]
+        return pathdata, num_pruned
+
+    def _compute_coverage(self, paths):
+        """Computes the coverage metrics of 'paths', on the pool if there is one. Paths sharing a footprint compute it once"""
+        targets = {}
+        for path in paths:
+            target = path.footprint if path.footprint is not None else path
+            if 'coverage_metrics' not in target.__dict__:
+                targets[id(target)] = target
+        targets = list(targets.values())
+        if self.pool is None or len(targets) <= 1:
+            for target in targets:
+                target.coverage_metrics
+        else:
+            for target, metrics in zip(targets, self.pool.map(_evaluate_coverage, [t.vertices for t in targets])):
+                target.__dict__['coverage_metrics'] = metrics
+
+    def evaluate_tiled(self, jobs, groups, num_candidates) -> list[list]:
+        """Evaluates grouped candidates (see evaluate()) tile by tile.
+        Paths are generated whole in this process, then the coverage of every distinct footprint is computed
+        over its strips, on the pool if there is one, and merged back into its metrics.
+        """
+        pathdata = [None] * num_candidates
+        footprints = {}
+        tiles, owners = [], []
+        for (slope, variants), members in zip(jobs, groups.values()):
+            swath_data = self.outline.swath_set(self.disp_diam, slope)
+            along, _ = Outline.sweep_axes(slope)
+            for (i, _), path in zip(members, self.outline.swath_variants(self.disp_diam, slope, variants, swath_data)):
+                pathdata[i] = path
+                target = path.footprint if path.footprint is not None else path
+                if id(target) not in footprints:
+                    footprints[id(target)] = target
+                    path_tiles = swath_tiles(target.vertices, swath_data[0], swath_data[1], along, self.disp_diam, self.tile_swaths)
+                    tiles += path_tiles
+                    owners += [id(target)] * len(path_tiles)
+
+        if self.pool is None:
+            results = [_tile_metrics(self.outline, self.disp_diam, tile) for tile in tiles]
+        else:
+            chunksize = max(1, len(tiles) // (4 * self.workers))
+            results = list(self.pool.map(_evaluate_tile, tiles, chunksize=chunksize))
+        for key, target in footprints.items():
+            target.__dict__['coverage_metrics'] = merge_metrics([m for owner, m in zip(owners, results) if owner == key])
+
+        for i, path in enumerate(pathdata):
+            pathdata[i] = [path, path.airtime, path.seeding_coverage_efficiency, path.spilled_area]
+        return pathdata
+
+
+_worker_outline = None
+_worker_disp_diam = None
+_worker_raster_grid = None
+
+
+def _init_worker(offset_outline, disp_diam, raster_grid=None, pids=None):
+    """Stores the outline (and raster grid) shared by every candidate in the worker process,
+    and reports the PID of the worker to 'pids' (a multiprocessing.SimpleQueue) if given"""
+    global _worker_outline, _worker_disp_diam, _worker_raster_grid
+    _worker_outline = offset_outline
+    _worker_disp_diam = disp_diam
+    _worker_raster_grid = raster_grid
+    if pids is not None:
+        pids.put(os.getpid())
+
+
+def _generate_paths(outline, disp_diam, raster_grid, slope, variants, swath_data=None):
+    """Generates the candidate paths of every (invert, reverse) variant of one slope,
+    estimating their coverage on 'raster_grid' if there is one.
+    swath_data: the swath lines of the slope if already known, see Outline.swath_set"""
+    paths = outline.swath_variants(disp_diam, slope, variants, swath_data)
+    for path in paths:
+        path.raster_grid = raster_grid
+        if path.footprint is not None:
+            path.footprint.raster_grid = raster_grid
+    return paths
+
+
+def _evaluate_slope(job):
+    """Generates and evaluates the variants of one slope in a worker process.
+    Returns the path vertices as an (N, 2) array, its swath slope, its airtime and its coverage metrics for every variant.
+    """
+    slope, variants, swath_data = job
+    paths = _generate_paths(_worker_outline, _worker_disp_diam, _worker_raster_grid, slope, variants, swath_data)
+    return [(path.vertices, path.swath_slope, path.airtime, path.coverage_metrics) for path in paths]
+
+
+def _outscored(best_case, evaluated, weights, floor, envelope) -> bool:
+    """Whether an evaluated candidate scores higher than a candidate at its 'best_case' values, whatever the
+    normalization ranges between the 'floor' (or the spread of the 'evaluated' values, if wider) and the 'envelope'.
+    A difference in the candidate's favour is scaled by the smallest range, one against it by the largest.
+    A min-max normalized metric lies within [0, 1], so the candidate never gains more than the weight of a metric on it.
+    """
+    if not len(evaluated):
+        return False
+    spread = np.maximum(evaluated.max(axis=0) - evaluated.min(axis=0), floor)
+    gain = weights * (best_case - evaluated)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        favourable = np.minimum(gain / spread, np.abs(weights))
+        normalized = np.where(gain > 0, favourable, np.where(gain < 0, gain / envelope, 0.0))
+    return bool((normalized.sum(axis=1) < 0).any())
+
+
+def _evaluate_coverage(vertices):
+    """Computes the coverage metrics of the path through 'vertices' in a worker process"""
+    path = Path(vertices, _worker_outline, _worker_disp_diam, None)
+    path.raster_grid = _worker_raster_grid
+    return path.coverage_metrics
+
+
+def _tile_metrics(outline, disp_diam, tile):
+    """Computes the coverage metrics of one (vertices, strip) tile of a path generated from 'outline'"""
+    vertices, strip = tile
+    outer_poly = outline.offsetparent if outline.offsetparent else outline
+    return tile_metrics(vertices, strip, disp_diam, outer_poly, outline)
+
+
+def _evaluate_tile(tile):
+    """Computes the coverage metrics of one tile in a worker process"""
+    return _tile_metrics(_worker_outline, _worker_disp_diam, tile)
+
+
+def _rebuild_path(vertices, parent, disp_diam, raster_grid, swath_slope, airtime, metrics):
+    """Rebuilds a Path evaluated in a worker process, with its metrics already cached"""
+    path = Path(vertices, parent, disp_diam, swath_slope)
+    path.raster_grid = raster_grid
+    path.__dict__.update(airtime=airtime, coverage_metrics=metrics)
+    return path
@@ -1,7 +1,11 @@
 # src/outline.py
 
+import shapely
 from shapely.geometry import LineString, Point, LinearRing, MultiPoint, Polygon
+from shapely.strtree import STRtree
+from functools import cached_property
 from basic_functions import *
+from transform import as_coord_array
 from path import *
 
 """
@@ -13,6 +17,8 @@ Description of the Outline class, its attributes, and methods.
 
 #TL:DR
 Outline instance has all the information about the polygon it describes.
+Outline instance stores the polygon as an (N, 2) array of vertices and its bounds. Its Shapely objects (ring, polygon,
+prepared polygon, children index) are only built when first needed, and are left out when the Outline is pickled.
 An Outline instance can store other Outline instances as its children if they are all fully contained within it.
 Outline instance generates a Path instance with the 'swath_gen()' function.
 """
@@ -20,25 +26,16 @@ Outline instance generates a Path instance with the 'swath_gen()' function.
 class Outline:
     def __init__(self, name: str, points: list, children=[], offsetparent=None):
         """
-        points:         list of (x, y) coordinates, in EPSG:3857 (meters)
+        points:         list of (x, y) coordinates or an (N, 2) array, in EPSG:3857 (meters)
         children:       a list of Outline Objects
         offsetparent:   an Outline object. If self is a polygon offsetted from another, it shows its parent here.
         """
         # Initialize basic polygon information from given points
-        self.xcoord = [i[0] for i in points]
-        self.ycoord = [i[1] for i in points]
-        self.xmax, self.xmin = max(self.xcoord), min(self.xcoord)
-        self.ymax, self.ymin = max(self.ycoord), min(self.ycoord)
+        self.vertices = as_coord_array(points)  # (N, 2)
+        self.xmin, self.ymin = self.vertices.min(axis=0).tolist()
+        self.xmax, self.ymax = self.vertices.max(axis=0).tolist()
         self.name = name
 
-        # define basic polygon information in shapely objects, necesary for executing Shapely functions
-        self.points = [Point(i[0], i[1]) for i in points]
-        self.ring = LinearRing(tuple(self.points))
-        self.polygon = Polygon(tuple(self.points))
-
-        self.centroid = self.polygon.centroid
-        self.area = self.polygon.area / 1000**2  # KM^2
-
         self.offsetparent = offsetparent
         self.children = self.children_setter(children)
         
@@ -52,9 +49,8 @@ class Outline:
         """
         newpoly = self.polygon.buffer(-offset, quad_segs=3)
         assert isinstance(newpoly, Polygon), "Offseting polygon has caused discontinuity in the field area. Try setting poly-offset parameter in construct_pathlist parameter"
-        x, y = newpoly.exterior.xy
-        coord_set = [(x[i], y[i]) for i in range(len(x))]
-        if not coord_set:
+        coord_set = shapely.get_coordinates(newpoly.exterior)
+        if not len(coord_set):
             raise ValueError("Unable to offset the existing polygon. Either try not adding an offset when constructing Path, or double check if the Outline is big enough (minimum width at any point is at least dispersion diameter)")
         inherit_children = list(self.children.values()) if self.children else None
         return Outline('offset', coord_set, children=inherit_children, offsetparent=self)
@@ -100,9 +96,8 @@ class Outline:
                 "The line doesn't intersect with the polygon. Call extrapolate_line() first before using span_line()")
 
         intersection_list = [self.ring.intersection(line)]
-        if self.children:
-            newlist = [excluded.ring.intersection(line) for excluded in self.children.values()]
-            intersection_list += [excluded.ring.intersection(line) for excluded in self.children.values()]
+        # only the children whose envelope the line touches can cross it
+        intersection_list += [excluded.ring.intersection(line) for excluded in self.query_children(line)]
         
         intersection_points = []
         for shp in intersection_list:
@@ -118,37 +113,54 @@ class Outline:
 
         return LineString(intersection_points) if len(intersection_points) >= 2 else Point(intersection_points[0])
 
-    def swath_gen(self, interval, slope, invert=False, _F_single_point=False, _R_single_point=False):
-        """Generates evenly spaced swath lines based on a baseline.
+    def swath_gen(self, interval, slope, invert=False, reverse=False):
+        """Generates evenly spaced swath lines based on a baseline, and weaves them into a complete path.
         The baseline is a line that passes through the centroid with the input slope.
-        Returns a complete path, which is a list of LineStrings
+        Returns the complete path as a Path instance.
 
-        interval:           dispersion diameter of the drone
-        slope:              the slope of the baseline (wind direction) in respect to the horizontal line
-        invert:             determines whether the path generated goes in the default (False) direction or an inverted (True) direction
-        show_baseline:      determines whether to display baseline in matplotlib graph
-
-        _F_single_point:    determines whether there is a single-point-intersection between swath line and polygon at the Front of the path
-        _R_single_point:    determines whether there is a single-point-intersection between swath line and polygon at the Rear of the path
+        interval:   dispersion diameter of the drone
+        slope:      the slope of the baseline (wind direction) in respect to the horizontal line
+        invert:     determines whether the path generated goes in the default (False) direction or an inverted (True) direction
+        reverse:    flies the path backwards, starting from the other end
         """
-        def swath_align(swath):
-            """ Aligns all LineStrings inside a swath based on the first one, so that the
-            starting point are on one side of the baseline, and the ending points are on the other
-            #* .intersection() arranges the two intersection points randomly, and hence the direction of swaths is random without rearranging
-
-            swath: a list of LineStrings
-            """
-            def _dir(line):
-                """returns the direction (vector form) of the input line"""
-                start, end = line.boundary.geoms[0], line.boundary.geoms[1]
-                return np.array([end.x - start.x, end.y - start.y])
-            base_direction = _dir(swath[0])
-
-            for lines in swath[1:]:
-                if np.dot(base_direction, _dir(lines)) < 0:
-                    swath[swath.index(lines)] = reverse_line(lines)
-            return swath
+        return self.swath_variants(interval, slope, [(invert, reverse)])[0]
+
+    def swath_variants(self, interval, slope, variants=((False, False), (True, False)), swath_data=None):
+        """Generates the paths of several direction variants of one slope from a single set of swath lines.
+        Returns a list of Path instances, one per variant.
+        A reversed path flies the same lines as its forward path, so it shares its coverage (see Path.footprint).
 
+        interval:   dispersion diameter of the drone
+        slope:      the slope of the baseline (wind direction) in respect to the horizontal line
+        variants:   a list of (invert, reverse) pairs, see swath_gen()
+        swath_data: the output of swath_set() for this slope, if it was already generated
+        """
+        swath, ends, opp_slope = self.swath_set(interval, slope) if swath_data is None else swath_data
+        forward = {}
+        paths = []
+        for invert, reverse in variants:
+            if invert not in forward:
+                forward[invert] = Path(self.weave_swath(swath, ends, invert), self, interval, opp_slope)
+            path = forward[invert]
+            if reverse:
+                path = Path(path.vertices[::-1], self, interval, opp_slope)
+                path.footprint = forward[invert]
+            paths.append(path)
+        return paths
+
+    def swath_set(self, interval, slope):
+        """Generates the evenly spaced swath lines of a slope, in flying order and alternating direction.
+        Returns (swath, ends, opp_slope): the swath lines as a list of (K, 2) coordinate arrays,
+        the single-point intersections (x, y) at the Front and Rear of the path (None if there is none),
+        and the slope of the swath lines.
+
+        The polygon and its children are rotated once into the sweep frame, where the baseline is the y-axis and the
+        swath lines are horizontal scanlines. Every scanline is intersected with every ring at once (see scanline_crossings()),
+        and a swath passes through all the crossings of its scanline, in increasing x (increasing y if vertical).
+
+        interval:   dispersion diameter of the drone
+        slope:      the slope of the baseline (wind direction) in respect to the horizontal line
+        """
         # Determines slope of the swaths (swaths are all perpendicular to baseline)
         if slope == "vertical":
             opp_slope = 0
@@ -157,91 +169,75 @@ class Outline:
         else:
             opp_slope = -(1 / slope)
 
-        # generate baseline
-        # * This method finds the minimum bounding box of the polygon in the direction of the baseline, and find max and min point baseline can extend to.
-        # * this implementation will ensure that no corners of the mapped area are left out in the constructed path (essentially addressing for edge cases)
-        proj_pt = []
-        baseline = self.extrapolate_line(self.centroid, slope)
-        for point in self.points:
-            # project all vertices of polygon onto the extrapolated line
-            proj_pt.append(pt_to_line(point, baseline))
-        # find the points on either end of the extrapolated line
-        if slope == "vertical":
-            topmostpoint = [max(proj_pt, key=lambda pt: pt.y)]
-            bottommostpoint = [min(proj_pt, key=lambda pt: pt.y)]
-
-            baseline = LineString([topmostpoint[0], bottommostpoint[0]])
+        along, across = self.sweep_axes(slope)
+        origin = np.array([self.centroid.x, self.centroid.y])
+        frame = np.array([across, along])
+        rings = [self.ring_coords] + [child.ring_coords for child in self.children.values()]
+        rings = [(ring - origin) @ frame.T for ring in rings]
+
+        # generate the baseline, spanning the polygon's vertices projected onto it
+        # * this ensures that no corners of the mapped area are left out in the constructed path (essentially addressing for edge cases)
+        start, end = rings[0][:, 1].min(), rings[0][:, 1].max()
+
+        # evenly spaced scanlines on the baseline, spaced as split_line() does
+        length = end - start
+        num_div = length / interval
+        if not 0 < num_div % 1 < 0.2:
+            num_div += 1
+        levels = start + np.linspace(0, length, int(num_div))
+        if len(levels) > 1:
+            levels[-1] = end
         else:
-            rightmostpoint = [max(proj_pt, key=lambda pt: pt.x)]
-            leftmostpoint = [min(proj_pt, key=lambda pt: pt.x)]
-            if slope > 0:
-                max_point = max(rightmostpoint, key=lambda pt: pt.y)
-                min_point = min(leftmostpoint, key=lambda pt: pt.y)
-            else:
-                max_point = min(rightmostpoint, key=lambda pt: pt.y)
-                min_point = max(leftmostpoint, key=lambda pt: pt.y)
-
-            baseline = LineString([line_intersection(self.centroid, slope, min_point, opp_slope), line_intersection(
-                self.centroid, slope, max_point, opp_slope)])
+            levels = np.array([start, end])
 
-        # generate evenly spaced points on the baseline
-        inter_points = split_line(baseline, interval)
-
-        # Generate swath if it intersects with the polygon.
-        swath = [self.extrapolate_line(i, opp_slope) for i in inter_points if self.ring.intersects(
-            self.extrapolate_line(i, opp_slope))]
-        swath = [self.span_line(i) for i in swath]
+        # intersect all scanlines with the polygon and its children, then rotate the crossings back
+        line, x = scanline_crossings(rings, levels)
+        points = origin + np.outer(x, across) + np.outer(levels[line], along)
+        counts = np.bincount(line, minlength=len(levels))
+        crossings = [c for c in np.split(points, np.cumsum(counts)[:-1]) if len(c)]
 
         # Check if there are single-point intersections (instead of Multi-point intersections)
         # Note that single-point intersections will only occur at Front (F) or Rear (R) or the whole path.
-        if any([isinstance(i, Point) for i in swath]):
-            if isinstance(swath[0], Point):
-                _F_single_point = True
-                first_point = swath[0]
-            if isinstance(swath[-1], Point):
-                _R_single_point = True
-                last_point = swath[-1]
-        swath = [i for i in swath if isinstance(i, LineString)]
-
-        # Align all swath path into the same orientation using swath_align
-        swath = swath_align(swath)
+        first_point = tuple(crossings[0][0]) if len(crossings[0]) == 1 else None
+        last_point = tuple(crossings[-1][0]) if len(crossings[-1]) == 1 else None
+        swath = [c for c in crossings if len(c) >= 2]
+
+        # All swaths go in the direction of the first one, alternate them
         for i in range(1, len(swath), 2):
-            swath[i] = reverse_line(swath[i])
+            swath[i] = swath[i][::-1]
 
+        return swath, (first_point, last_point), opp_slope
+
+    @staticmethod
+    def sweep_axes(slope):
+        """Returns the unit vectors (along, across) of the sweep frame of a baseline slope:
+        'along' the baseline (left to right, top to bottom if vertical), and 'across' it, the direction of the first swath.
+        """
+        if slope == "vertical":
+            return np.array([0.0, -1.0]), np.array([1.0, 0.0])
+        along = np.array([1.0, slope]) / np.hypot(1.0, slope)
+        across = np.array([along[1], -along[0]]) if slope > 0 else np.array([-along[1], along[0]])
+        return along, across
+
+    @staticmethod
+    def weave_swath(swath, ends, invert=False) -> np.ndarray:
+        """Weaves swath lines into the (N, 2) vertex array of the complete path.
+        The intermediate lines connecting the swaths are the joins between the end of one swath and the start of the next.
+
+        swath:  swath lines as coordinate arrays, see swath_set()
+        ends:   single-point intersections at the Front and Rear of the path, see swath_set()
+        invert: determines whether the path goes in the default (False) direction or an inverted (True) direction
+        """
         # Check if the default path or inverted path should be generated
-        if invert:
-            for i in range(len(swath)):
-                swath[i] = reverse_line(swath[i])
-
-        # Create intermediate lines that connects all swaths
-        inter_lines = []
-        for i in range(len(swath) - 1):
-            inter_lines.append(LineString(
-                (swath[i].boundary.geoms[1], swath[i+1].boundary.geoms[0])))
-
-        # Weave intermediate lines into swath to form the complete path
-        complete_path = []
-        for i in range(len(inter_lines)):
-            complete_path.append(swath[i])
-            complete_path.append(inter_lines[i])
-        complete_path.append(swath[-1])
+        parts = [line[::-1] for line in swath] if invert else list(swath)
 
         # Add front or back single-point intersections (if there are any) to complete the ends of the path
-        if _F_single_point:
-            first_line = LineString([first_point, swath[0].boundary.geoms[0]])
-            complete_path.insert(0, first_line)
-        if _R_single_point:
-            last_line = LineString([swath[-1].boundary.geoms[1], last_point])
-            complete_path.append(last_line)
-
-        # Break multi-point swath into multiple 2-point LineStrings
-        final_path = []
-        for line in complete_path:
-            final_path.extend(break_line(line))
-
-        check_continuity(final_path)
-
-        return Path(final_path, self, interval, opp_slope)
+        first_point, last_point = ends
+        if first_point is not None:
+            parts.insert(0, [first_point])
+        if last_point is not None:
+            parts.append([last_point])
+        return np.concatenate(parts)
 
     """
     ===========================
@@ -275,6 +271,7 @@ class Outline:
         if not isinstance(child, Outline):
             raise ValueError("input must be an Outline object")
         self.children[child.name] = child
+        self.__dict__.pop('children_tree', None)
 
     def remove_child(self, child):
         """Removes a child from the polygon's list of children
@@ -287,3 +284,74 @@ class Outline:
             print("There are no children to remove.")
         else:
             self.children.pop(child.name)
+            self.__dict__.pop('children_tree', None)
+
+    def query_children(self, geometry) -> list:
+        """Returns the children whose envelope intersects the envelope of 'geometry', looked up in children_tree
+
+        geometry: a Shapely geometry
+        """
+        if not self.children:
+            return []
+        children = list(self.children.values())
+        return [children[i] for i in sorted(self.children_tree.query(geometry))]
+
+    def __getstate__(self):
+        """Pickles the vertices, bounds and children only. Cached (mostly Shapely) properties are rebuilt when needed"""
+        lazy = [key for key, value in vars(Outline).items() if isinstance(value, cached_property)]
+        return {key: value for key, value in self.__dict__.items() if key not in lazy}
+
+    """
+    =========================
+    === Cached Properties ===
+    =========================
+    """
+
+    @cached_property
+    def ring_coords(self) -> np.ndarray:
+        """The vertices as a closed ring, first and last being equal"""
+        if len(self.vertices) and (self.vertices[0] != self.vertices[-1]).any():
+            return np.vstack((self.vertices, self.vertices[:1]))
+        return self.vertices
+
+    @cached_property
+    def xcoord(self) -> list[float]:
+        return self.vertices[:, 0].tolist()
+
+    @cached_property
+    def ycoord(self) -> list[float]:
+        return self.vertices[:, 1].tolist()
+
+    @cached_property
+    def points(self) -> list[Point]:
+        return list(shapely.points(self.vertices))
+
+    @cached_property
+    def ring(self) -> LinearRing:
+        # define basic polygon information in shapely objects, necesary for executing Shapely functions
+        return LinearRing(self.vertices)
+
+    @cached_property
+    def polygon(self) -> Polygon:
+        return Polygon(self.vertices)
+
+    @cached_property
+    def centroid(self) -> Point:
+        return self.polygon.centroid
+
+    @cached_property
+    def area(self) -> float:
+        return self.polygon.area / 1000**2  # KM^2
+
+    @cached_property
+    def containment_polygon(self) -> Polygon:
+        """The polygon buffered by 1e-8 to account for Python rounding error, prepared for repeated containment tests"""
+        polygon = self.polygon.buffer(1e-8)
+        shapely.prepare(polygon)
+        return polygon
+
+    @cached_property
+    def children_tree(self) -> STRtree:
+        """Spatial index over the children's containment polygons, in the order of self.children.
+        Built once, and rebuilt after add_child() or remove_child()."""
+        return STRtree([child.containment_polygon for child in self.children.values()])
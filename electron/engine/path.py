@@ -3,7 +3,9 @@
 from basic_functions import *
 from segment import *
 from graph import *
+from coverage import swath_coverage, coverage_metrics, RasterGrid
 import math
+import shapely
 from shapely.geometry import LineString
 from functools import cached_property
 
@@ -16,25 +18,34 @@ Description of the Path class, its attributes, and methods.
 
 #TL:DR
 Path instance has information about the default parameters of the drone (velocity & acceleration)
-Path instance has the information of the path as a list of lines, which can be broken down into denser waypoints.
+Path instance stores the path as an (N, 2) array of vertices. Consecutive vertices form the 2-point lines of the path,
+which are only built as LineString objects when needed (display and export), and can be broken down into denser waypoints.
 A Path instance breaks the each LineString it contains into a series of Segment instances
 Path instance has information about its parent Outline instance
 """
 
+# Maximum distance (m) between consecutive waypoints
+WAYPOINT_SPACING = 100
+# Number of waypoints generated at once by Path.iter_waypoints
+WAYPOINT_CHUNK_SIZE = 100000
+
 class Path:
     """
     Path class processes the path object and extracts information about the path.
     """
 
-    def __init__(self, path: list[LineString], parent, disp_diam, swath_slope, start_velo=0, end_velo=0):
+    def __init__(self, path, parent, disp_diam, swath_slope, start_velo=0, end_velo=0):
         """
-        path:           a list of LineStrings. Usually the output of generate_path() function
+        path:           an (N, 2) array of vertices, or a list of continuous LineStrings. Usually the output of swath_gen() function
         parent:         the polygon object the path belongs to
         swath_slope:    the slope of the swath lines of this path instance
         start_velo:     starting velocity of this path, static (0) by default
         end_velo:     ending velocity of this path, static (0) by default
         """
-        self.path = path                    #2D Path
+        if isinstance(path, (list, tuple)) and path and isinstance(path[0], LineString):
+            path = vertices_from_lines(path)
+        self.vertices = np.ascontiguousarray(path, dtype=np.float64)   #2D Path, (N, 2)
+        assert self.vertices.ndim == 2 and self.vertices.shape[1] == 2 and len(self.vertices) >= 2, "a path needs at least 2 vertices"
         self.parent = parent
         self.disp_diam = disp_diam
         self.swath_slope = swath_slope
@@ -56,28 +67,29 @@ class Path:
         self.nondisp_velo = 200  # KM/h
         # KM, minimum distance for drone to accelerate or decelerate to disp_velo
         self.turn_dist = 0.1
+
+        # elevation provider used by critical_elevations / waypoint_elevations. None uses the default of get_elevation()
+        self.elevation_provider = None
+        # RasterGrid of the field. When set, coverage metrics are estimated on the grid instead of computed exactly
+        self.raster_grid = None
+        # Path flying the same lines as this one (e.g. this path reversed). Its coverage is shared instead of recomputed
+        self.footprint = None
         
         #*If the attribute you are looking for isn't in __init__, look for it at the bottom in @cached_properties
 
-    def to_coordinates(self):
+    def to_coordinates(self, geographic=False):
         """
-        Transforms projected coordinates to geographic coordinates and returns a detailed list of
-        dictionaries, each representing a line segment with its start and end geographic coordinates.
-        """
-        detailed_coords = []
-        path_coords = []  # List to hold all coordinates for batch transformation
+        Returns a detailed list of dictionaries, each representing a line segment with its start and end coordinates.
 
-        for line in self.path:
-            # Extract and collect all points for transformation
-            start_point = line.coords[0]
-            end_point = line.coords[-1]
-            path_coords.extend([start_point, end_point])
-
-        # Convert all collected points from EPSG:3857 to EPSG:4326
-        # transformed_coords = pcs2gcs_batch(coords_to_transform)
+        geographic:     if True, coordinates are transformed from EPSG:3857 to EPSG:4326 (lon&lat) in a single batch.
+                        The GUI map draws in EPSG:3857, so projected coordinates are returned by default.
+        """
+        # Convert all vertices from EPSG:3857 to EPSG:4326
+        path_coords = pcs2gcs_batch(self.vertices) if geographic else self.vertices.tolist()
 
-        # Iterate over transformed coordinates in pairs (start, end)
-        for i in range(0, len(path_coords), 2):
+        # Each line spans a pair of consecutive vertices (start, end)
+        detailed_coords = []
+        for i in range(len(path_coords) - 1):
             start_geo = path_coords[i]
             end_geo = path_coords[i + 1]
             detailed_coords.append({
@@ -87,6 +99,20 @@ class Path:
 
         return detailed_coords
 
+    def export_waypoints(self, filepath, geographic=False, chunk_size=WAYPOINT_CHUNK_SIZE):
+        """Writes the waypoints to a CSV file with columns x, y, dispersing, streaming them chunk by chunk.
+
+        filepath:   path of the CSV file
+        geographic: if True, coordinates are written in EPSG:4326 (lon&lat) instead of EPSG:3857
+        chunk_size: number of waypoints converted and written at once, see iter_waypoints
+        """
+        with open(filepath, 'w') as file:
+            file.write("x,y,dispersing\n")
+            for points, dispersing in self.iter_waypoints(chunk_size):
+                if geographic:
+                    points = np.asarray(pcs2gcs_batch(points))
+                np.savetxt(file, np.column_stack((points, dispersing)), delimiter=',', fmt=('%.9f', '%.9f', '%d'))
+
     
     def path_offset(self, wind_dir, height, seed_weight=0.00085):
         """Returns an offsetted path based on the wind direction, drone height, and seed weight.
@@ -124,38 +150,14 @@ class Path:
         offset_x = wind_displacement_x
         offset_y = wind_displacement_y
 
-        offset_path = []
-        for line in self.path:
-            offset_coords = [(x + offset_x, y + offset_y) for x, y in line.coords]
-            offset_path.append(LineString(offset_coords))
+        offset_path = self.vertices + (offset_x, offset_y)
 
         return Path(offset_path, self.parent, self.disp_diam, self.swath_slope, self.start_velo, self.end_velo)
 
     def _coverage_compute(self):
-        #Define border of Field
-        outer_poly = self.parent.offsetparent if self.parent.offsetparent else self.parent
-        
-        #Total drone coverage
-        self_coverage = self.coverage()
-        total_drone_covered_area = self_coverage.area / 1000**2 #KM^2
-        
-        #Total internal exclusion area (KM^2) and Total internal exclusion area covered by drone
-        if outer_poly.children:
-            excluded_area = sum([child.polygon.area for child in outer_poly.children.values()]) / 1000**2
-            drone_covered_excluded_area = sum([self_coverage.intersection(child.polygon).area for child in self.parent.children.values()]) / 1000**2
-        else:
-            excluded_area = 0
-            drone_covered_excluded_area = 0
-        
-        #Total field area desired to be covered
-        desired_coverage = outer_poly.polygon.area
-        desired_coverage = desired_coverage / 1000**2 - excluded_area #KM^2
-        
-        #Total seed dispersed area by drone 
-        covered_field_area = self_coverage.intersection(outer_poly.polygon).area / 1000**2
-        seed_disp_area = (covered_field_area - drone_covered_excluded_area) #KM^2
-        
-        return seed_disp_area, total_drone_covered_area, desired_coverage
+        """Returns the seeded area, the total covered area and the desired coverage (KM^2), see coverage_metrics"""
+        metrics = self.coverage_metrics
+        return metrics['seed_disp_area'], metrics['total_covered_area'], metrics['desired_coverage']
     
     """
     ===============
@@ -175,15 +177,11 @@ class Path:
 
         label_helper_disp = False  # Create tracking variable so only 1 label appears on legend
         label_helper_nondisp = False
-        for i, lines in enumerate(self.path):
-            start, end = lines.coords[0], lines.coords[1]
-            xx, yy = [start[0], end[0]], [start[1], end[1]]
-            if i == 0:
-                # store starting point
-                x_s, y_s = lines.boundary.geoms[0].x, lines.boundary.geoms[0].y
-            if i == len(self.path) - 1:
-                # store ending point
-                x_e, y_e = lines.boundary.geoms[1].x, lines.boundary.geoms[1].y
+        # store starting and ending point
+        x_s, y_s = self.vertices[0]
+        x_e, y_e = self.vertices[-1]
+        for i in range(len(self.vertices) - 1):
+            xx, yy = self.vertices[i:i+2, 0], self.vertices[i:i+2, 1]
             if self.disp_map[i]:
                 if label_helper_disp:
                     ax.plot(xx, yy, 'go-', ms=6, linewidth=2.5)
@@ -214,8 +212,7 @@ class Path:
         return ax
 
     def coverage(self) -> Polygon:
-        linepath = merge_line(self.path)
-        return linepath.buffer(self.disp_diam / 2, quad_segs=3)
+        return self.coverage_polygon
 
     def coverage_disp(self, ax):
         """displays the coverage of the path along with the area to be covered.
@@ -255,79 +252,103 @@ class Path:
     === Attribute Setters ===
     =========================    
     """
+    @cached_property
+    def path(self) -> list[LineString]:
+        """The path as a list of 2-point LineStrings, built from the vertices on first access"""
+        return list(shapely.linestrings(np.stack((self.vertices[:-1], self.vertices[1:]), axis=1)))
+
     @cached_property
     def coords(self) -> list[Point]:
         """Generate coordinates from path"""
-        coordinates = []
-        for lines in self.path:
-            coordinates.append(lines.boundary.geoms[0])
-        coordinates.append(self.path[-1].boundary.geoms[1])
-        return coordinates
-    
+        return list(shapely.points(self.vertices))
+
     @cached_property
-    def _compressed_waypoints(self) -> list[list[Point]]:
-        """Returns a list of list of coordinates, representing each straight line being decomposed into waypoints closer together."""
-        waypoints = []
-        for line in self.path:
-            num_div = line.length // 100 + 2
-            distances = np.linspace(0, line.length, int(num_div))
-            waypoints.append([line.interpolate(distance) for distance in distances])        
-        return waypoints
+    def segment_lengths(self) -> np.ndarray:
+        """Length (m) of every line of the path"""
+        return np.sqrt((np.diff(self.vertices, axis=0) ** 2).sum(axis=1))
     
     @cached_property
-    def _compressed_waypoints_path(self) -> list[list[LineString]]:
-        return [create_line(ptlist) for ptlist in self._compressed_waypoints]
-    
+    def waypoint_counts(self) -> np.ndarray:
+        """Number of waypoint lines every line of the path is decomposed into, so that waypoints are at most WAYPOINT_SPACING apart"""
+        return (self.segment_lengths // WAYPOINT_SPACING + 1).astype(np.intp)
+
+    @cached_property
+    def waypoint_array(self) -> np.ndarray:
+        """(M, 2) array of the waypoints: every line evenly decomposed into waypoint_counts lines, the vertices included"""
+        return densify_vertices(self.vertices, self.waypoint_counts)
+
     @cached_property
     def waypoints(self) -> list[Point]:
-        """Returns a list of coordinates. Essentially un-nesting all lists inside _compressed_waypoints"""
-        uncompressed = []
-        for subpath in self._compressed_waypoints[:-1]:
-            uncompressed.extend(subpath[:-1])
-        uncompressed.extend(self._compressed_waypoints[-1])
-        return uncompressed
-    
+        """Returns the waypoints as a list of Points, built from waypoint_array"""
+        return list(shapely.points(self.waypoint_array))
+
     @cached_property
     def waypoints_path(self) -> list[LineString]:
-        """Constructs a list of LineStrings based on the un-nested waypoints."""
-        return create_line(self.waypoints)
-    
+        """Returns the 2-point LineStrings between consecutive waypoints, built from waypoint_array"""
+        waypoints = self.waypoint_array
+        return list(shapely.linestrings(np.stack((waypoints[:-1], waypoints[1:]), axis=1)))
+
     @cached_property
-    def waypoints_disp_map(self) -> list[bool]:
-        """Constructs a dispersion map of the waypoints, giving information of the velocity at each waypoint."""
-        map = []
-        for index, bool in enumerate(self.disp_map):
-            map.extend([bool] * len(self._compressed_waypoints_path[index]))
-        return map
-    
+    def waypoints_disp_map(self) -> np.ndarray:
+        """Constructs a dispersion map of the waypoints, one flag per waypoint line."""
+        return np.repeat(self.disp_map, self.waypoint_counts)
+
+    def iter_waypoints(self, chunk_size=WAYPOINT_CHUNK_SIZE):
+        """Yields the waypoints in consecutive chunks, without building the whole waypoint array.
+        Every chunk is a (points, dispersing) pair: a (K, 2) array of waypoints and the K flags of the waypoint lines
+        starting at them (the last waypoint of the path starts no line and is flagged False).
+        Chunks hold whole lines of the path, about 'chunk_size' waypoints each (more if a single line is longer).
+
+        chunk_size: number of waypoints per chunk
+        """
+        counts = self.waypoint_counts
+        ends = np.cumsum(counts)
+        num_lines = len(counts)
+        start = 0
+        while start < num_lines:
+            done = ends[start - 1] if start else 0
+            stop = max(start + 1, int(np.searchsorted(ends, done + chunk_size, side='right')))
+            points = densify_vertices(self.vertices[start:stop + 1], counts[start:stop])
+            dispersing = np.repeat(self.disp_map[start:stop], counts[start:stop])
+            if stop < num_lines:
+                # the end vertex of the chunk starts the next chunk
+                points = points[:-1]
+            else:
+                dispersing = np.r_[dispersing, False]
+            yield points, dispersing
+            start = stop
+
     @cached_property
-    def disp_map(self) -> list[bool]:
+    def disp_map(self) -> np.ndarray:
         """Determines the max velocity of each corresponding Segment within the Path within the Polygon.
         Note that lines that connects the swath are not dispersing lines.
+        Returns a boolean array, one flag per line.
         """
-        map = []
-        for line in self.path:
-            if (line_slope(line) == "vertical" and self.swath_slope != "vertical"):
-                map.append(False)
-            elif (line_slope(line) != "vertical" and self.swath_slope == "vertical"):
-                map.append(False)
-            elif (line_slope(line) == "vertical" and self.swath_slope == "vertical"):
-                map.append(True)
-            elif not np.isclose(line_slope(line), self.swath_slope, rtol=1e-05, atol=1e-08, equal_nan=False):
-                # If the slope doesn't match the swath slope, then the line is a intermediate line that connects the swath, hence not a dispersing line.
-                map.append(False)
-            elif not self.parent.polygon.buffer(1e-8).contains(line):
-                # If the line isn't inside the polygon, then the line isn't a dispersing line
-                # Note that .buffer is used to account for Python rounding error
-                map.append(False)
-            elif self.parent.children:
-                # If the line is inside of any internal polygons (e.g. lakes), then the line isn't a dispersing line
-                if any([c.polygon.buffer(1e-8).contains(line) for c in self.parent.children.values()]):
-                    map.append(False)
-                else:
-                    map.append(True)
-            else:
-                map.append(True)
+        dx, dy = np.diff(self.vertices, axis=0).T
+        vertical = dx == 0
+        if self.swath_slope == "vertical":
+            # Only vertical lines follow vertical swaths
+            return vertical
+        
+        # If the slope doesn't match the swath slope, then the line is a intermediate line that connects the swath, hence not a dispersing line.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slopes = dy / dx
+        map = ~vertical & np.isclose(slopes, self.swath_slope, rtol=1e-05, atol=1e-08, equal_nan=False)
+        
+        # Containment is only tested for the remaining swath lines, all at once
+        candidates = np.flatnonzero(map)
+        if len(candidates):
+            lines = shapely.linestrings(np.stack((self.vertices[candidates], self.vertices[candidates + 1]), axis=1))
+            # If the line isn't inside the polygon, then the line isn't a dispersing line
+            inside = shapely.contains(self.parent.containment_polygon, lines)
+            # If the line is inside of any internal polygons (e.g. lakes), then the line isn't a dispersing line
+            # Only the (line, child) pairs whose envelopes intersect are tested
+            if self.parent.children:
+                children = np.array([c.containment_polygon for c in self.parent.children.values()], dtype=object)
+                line_idx, child_idx = self.parent.children_tree.query(lines)
+                within = shapely.contains(children[child_idx], lines[line_idx])
+                inside[line_idx[within]] = False
+            map[candidates] = inside
         return map
     
     @cached_property
@@ -335,11 +356,13 @@ class Path:
         """Returns the length of path in KM
         Note that the point coordinates in self.path are in unit of longtitude and latitude.
         """
-        return sum([line.length for line in self.path]) / 1000
+        return self.segment_lengths.sum() / 1000
 
     @cached_property
     def segment_list(self) -> list[Segment]:
-        """Returns the projected airtime when executing the given path"""
+        """Returns every line of the path as a Segment instance.
+        Airtime is computed by segment_times instead; this is kept for inspecting individual segments.
+        """
         def velo_mapper(index):
             """Returns the velocity of the segment depending on whether 
             the number 'index' path in self.path is a dispersing of non-dispersing path.
@@ -366,12 +389,42 @@ class Path:
 
         return airtime_list
 
+    @cached_property
+    def turn_angles(self) -> np.ndarray:
+        """Angle (degrees) between every pair of consecutive lines"""
+        return turn_angles(self.vertices)
+
+    @cached_property
+    def segment_times(self) -> np.ndarray:
+        """Time (hours) to cover every line, computed for the whole path at once. Matches Segment.time of segment_list."""
+        velocities = np.where(self.disp_map, self.disp_velo, self.nondisp_velo)
+        return segment_times(self.segment_lengths / 1000, velocities, self.turn_angles, self.turn_dist,
+                             self.start_velo, self.end_velo)
+
     @cached_property
     def airtime(self) -> float:
-        # compute total path time from all segment instances
-        tot_hour = sum([seg.time for seg in self.segment_list])
+        # compute total path time from all segment times
+        tot_hour = float(self.segment_times.sum())
         return tot_hour
     
+    @cached_property
+    def coverage_polygon(self) -> Polygon:
+        """Area covered by the drone along the path"""
+        if self.footprint is not None:
+            return self.footprint.coverage_polygon
+        return swath_coverage(self.vertices, self.disp_diam)
+
+    @cached_property
+    def coverage_metrics(self) -> dict:
+        """Every coverage quantity of the path, computed once. See coverage.coverage_metrics and RasterGrid"""
+        if self.footprint is not None:
+            return self.footprint.coverage_metrics
+        if self.raster_grid is not None:
+            return self.raster_grid.coverage_metrics(self.vertices, self.disp_diam)
+        #Define border of Field
+        outer_poly = self.parent.offsetparent if self.parent.offsetparent else self.parent
+        return coverage_metrics(self.coverage_polygon, outer_poly, self.parent)
+
     @cached_property
     def seeding_coverage_efficiency(self):
         #Percent drone-dispersed area over desired covered area
@@ -381,17 +434,27 @@ class Path:
     def spilled_area(self):
         #Total 'spilled-over' area not within the desired field
         return self._coverage_compute()[1] - self._coverage_compute()[0] #KM^2
+
+    @cached_property
+    def seeding_coverage_efficiency_error(self):
+        #Estimated absolute error (%) of seeding_coverage_efficiency, 0 for exact coverage
+        return self.coverage_metrics.get('seed_disp_area_error', 0) / self._coverage_compute()[2] * 100 #%
+
+    @cached_property
+    def spilled_area_error(self):
+        #Estimated absolute error (KM^2) of spilled_area, 0 for exact coverage
+        metrics = self.coverage_metrics
+        return metrics.get('total_covered_area_error', 0) + metrics.get('seed_disp_area_error', 0) #KM^2
     
     @cached_property
     def critical_elevations(self) -> list[float]:
         """returns a list of elevation corresponding to the critical point coordinates"""
         points_tup = [(pts.x, pts.y) for pts in self.coords]
-        elevation = get_elevation(points_tup)        
+        elevation = get_elevation(points_tup, self.elevation_provider)
         return elevation
     
     @cached_property
     def waypoint_elevations(self) -> list[float]:
         """returns a list of elevation corresponding to the waypoint coordinates"""
-        points_tup = [(pts.x, pts.y) for pts in self.waypoints]
-        elevation = get_elevation(points_tup)        
+        elevation = get_elevation(self.waypoint_array, self.elevation_provider)
         return elevation
\ No newline at end of file
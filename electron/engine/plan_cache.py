@@ -0,0 +1,204 @@
+# src/plan_cache.py
+
+import os
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import closing
+import numpy as np
+from path import Path
+
+"""
+==================
+=== Plan Cache ===
+==================
+
+Description of the cache of planning results used by construct_pathlist() and main.optimize().
+
+#TL:DR
+Every cached result is addressed by plan_key(), a SHA-256 hash of a canonical encoding of everything it depends on:
+the field and children vertices, disp_diam, the offset, the slope, the coverage settings and the drone parameters.
+Re-planning the same field with the same settings finds its results again, while any change gives new keys.
+PlanCache holds pickled results in two tiers: an in-memory LRU and a sqlite file on disk. Both are bounded in bytes,
+and the disk tier evicts its least recently used entries first, so the cache can be kept across seasons.
+Cached results are the offset outline of a field, the swath lines of every slope, the path and metrics of every
+candidate, and the best path of a whole plan.
+"""
+
+PLAN_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "plan_cache.sqlite")
+# Bumped whenever planning changes, so results of an older engine are never reused
+PLAN_CACHE_VERSION = 2
+
+
+def plan_key(*parts) -> str:
+    """Returns the SHA-256 hex digest of a canonical encoding of 'parts'.
+    Numbers are encoded by value (1 and 1.0 give the same key), coordinates as float64 arrays, dictionaries by sorted keys.
+
+    parts:  numbers, strings, None, booleans, arrays and (nested) lists, tuples or dictionaries of them
+    """
+    digest = hashlib.sha256()
+    _encode(parts, digest)
+    return digest.hexdigest()
+
+
+def _encode(value, digest):
+    """Feeds the canonical encoding of 'value' into 'digest'"""
+    if value is None or isinstance(value, (bool, str)):
+        digest.update(f"{type(value).__name__}:{value};".encode())
+    elif isinstance(value, (int, float, np.integer, np.floating)):
+        digest.update(f"num:{float(value)!r};".encode())
+    elif isinstance(value, dict):
+        digest.update(b"{")
+        for k in sorted(value, key=str):
+            _encode(str(k), digest)
+            _encode(value[k], digest)
+        digest.update(b"}")
+    elif isinstance(value, np.ndarray) and value.dtype != object:
+        array = np.ascontiguousarray(value, dtype=np.float64)
+        digest.update(f"array:{array.shape};".encode())
+        digest.update(array.tobytes())
+    elif isinstance(value, (list, tuple, np.ndarray)):
+        try:
+            array = np.asarray(value, dtype=np.float64)
+        except (TypeError, ValueError):
+            array = None
+        if array is not None and array.ndim > 0:
+            _encode(array, digest)
+            return
+        digest.update(b"[")
+        for item in value:
+            _encode(item, digest)
+        digest.update(b"]")
+    else:
+        raise TypeError(f"Cannot build a plan key from {type(value).__name__}")
+
+
+def drone_parameters() -> dict:
+    """Returns the drone parameters a Path is created with (velocities and turning distance), which airtime depends on"""
+    path = Path(np.zeros((2, 2)), None, 1, 0)
+    return {name: getattr(path, name) for name in ('disp_velo', 'nondisp_velo', 'turn_dist', 'start_velo', 'end_velo')}
+
+
+def field_key(coords, disp_diam, children=None, poly_offset=None, simplify=None) -> str:
+    """Returns the key of a field as planned by construct_pathlist(): its vertices, its children's vertices, the offset
+    and the simplification. Other keys of the same field are derived from this one.
+    """
+    if children is not None and not isinstance(children, (list, tuple)):
+        children = [children]
+    children_vertices = [child.vertices for child in children] if children else []
+    return plan_key('field', PLAN_CACHE_VERSION, np.asarray(coords, dtype=np.float64), children_vertices,
+                    disp_diam, poly_offset, simplify)
+
+
+class PlanCache:
+    """
+    Two-tier cache of planning results. Values are pickled, so every get returns a fresh copy.
+    The memory tier keeps the most recently used entries of this process, the disk tier keeps entries across runs.
+    """
+
+    def __init__(self, cache_path=PLAN_CACHE_PATH, memory_bytes=64 * 2**20, disk_bytes=512 * 2**20):
+        """
+        cache_path:     path of the sqlite file of the disk tier. None keeps the cache in memory only.
+        memory_bytes:   maximum size of the pickled entries kept in memory
+        disk_bytes:     maximum size of the pickled entries kept on disk. Least recently used entries are evicted first.
+        """
+        self.cache_path = cache_path
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.hits = {'memory': 0, 'disk': 0}
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        if cache_path:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            with closing(self._connect()) as db, db:
+                db.execute("CREATE TABLE IF NOT EXISTS plan "
+                           "(key TEXT PRIMARY KEY, value BLOB, size INTEGER, accessed REAL)")
+
+    def get(self, key, default=None):
+        """Returns the value cached under 'key', from memory first and then from disk, or 'default' if there is none"""
+        with self._lock:
+            blob = self._memory.get(key)
+            if blob is not None:
+                self._memory.move_to_end(key)
+                self.hits['memory'] += 1
+                return pickle.loads(blob)
+        if self.cache_path:
+            with closing(self._connect()) as db, db:
+                row = db.execute("SELECT value FROM plan WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    db.execute("UPDATE plan SET accessed = ? WHERE key = ?", (time.time(), key))
+            if row is not None:
+                blob = bytes(row[0])
+                with self._lock:
+                    self.hits['disk'] += 1
+                    self._remember(key, blob)
+                return pickle.loads(blob)
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def put(self, key, value):
+        """Caches 'value' under 'key' in both tiers, evicting the least recently used entries beyond the size limits"""
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._remember(key, blob)
+        if self.cache_path and len(blob) <= self.disk_bytes:
+            with closing(self._connect()) as db, db:
+                db.execute("INSERT OR REPLACE INTO plan VALUES (?, ?, ?, ?)", (key, blob, len(blob), time.time()))
+                self._evict(db)
+
+    def get_or_compute(self, key, compute):
+        """Returns the value cached under 'key', computing it with compute() and caching it on a miss"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        """Removes every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+        if self.cache_path:
+            with closing(self._connect()) as db, db:
+                db.execute("DELETE FROM plan")
+
+    def _remember(self, key, blob):
+        """Stores a pickled entry in the memory tier, evicting the least recently used ones beyond memory_bytes.
+        Call with the lock held.
+        """
+        if key in self._memory:
+            self._memory_size -= len(self._memory.pop(key))
+        if len(blob) > self.memory_bytes:
+            return
+        self._memory[key] = blob
+        self._memory_size += len(blob)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _evict(self, db):
+        """Deletes the least recently used disk entries until the disk tier fits in disk_bytes"""
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM plan").fetchone()[0]
+        if total <= self.disk_bytes:
+            return
+        evicted = []
+        for key, size in db.execute("SELECT key, size FROM plan ORDER BY accessed"):
+            if total <= self.disk_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        db.executemany("DELETE FROM plan WHERE key = ?", evicted)
+
+    def _connect(self):
+        return sqlite3.connect(self.cache_path, timeout=30)
+
+
+_MISSING = object()
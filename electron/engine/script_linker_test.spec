@@ -7,12 +7,19 @@ a = Analysis(
     binaries=[],
     datas=[
         ('./basic_functions.py', './basic_functions.py'),
+        ('./coverage.py', './coverage.py'),
+        ('./daemon.py', './daemon.py'),
+        ('./elevation.py', './elevation.py'),
         ('./graph.py', './graph.py'),
+        ('./ipc.py', './ipc.py'),
         ('./main.py', './main.py'),
         ('./optimization.py', './optimization.py'),
         ('./outline.py', './outline.py'),
         ('./path.py', './path.py'),
+        ('./plan_cache.py', './plan_cache.py'),
         ('./segment.py', './segment.py'),
+        ('./tiling.py', './tiling.py'),
+        ('./transform.py', './transform.py'),
     ],
     hiddenimports=[],
     hookspath=[],
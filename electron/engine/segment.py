@@ -90,3 +90,39 @@ class Segment:
             tot_time = (2 * self.length) / (self.prev_velo + self.next_velo)
 
         return tot_time  # hours
+
+
+"""
+==========================
+=== Vectorized Airtime ===
+==========================
+"""
+
+def segment_times(lengths, velocities, angles, turn_dist, start_velo=0, end_velo=0) -> np.ndarray:
+    """Returns the time (in hours) of every line of a path in one pass. Gives the same result as Segment.time for each line.
+
+    lengths:    (M,) array of line lengths (KM)
+    velocities: (M,) array of the velocity (KM/h) the drone travels each line at
+    angles:     (M-1,) array of the angles (degrees) between consecutive lines, see basic_functions.turn_angles()
+    turn_dist:  minimum distance (KM) for the drone to accelerate or decelerate
+    start_velo: starting velocity of the path
+    end_velo:   ending velocity of the path
+    """
+    lengths = np.asarray(lengths, dtype=np.float64)
+    curr_velo = np.asarray(velocities, dtype=np.float64)
+    prev_velo = np.r_[start_velo, curr_velo[:-1]]
+    next_velo = np.r_[curr_velo[1:], end_velo]
+    # the first and last lines have no previous / next angle, which Segment treats like a 0 angle
+    prev_angle = np.r_[0, angles]
+    next_angle = np.r_[angles, 0]
+
+    # determine starting and ending velocity of the acc/deceleration, see Segment.start_velo and Segment.end_velo
+    start = np.where(prev_angle != 0, np.where(prev_angle <= 90, (prev_velo + curr_velo) / 2, 0), prev_velo)
+    end = np.where(next_angle != 0, np.where(next_angle <= 90, (curr_velo + next_velo) / 2, 0), next_velo)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # acc/deceleration time + constant velocity time
+        full_time = (2 * turn_dist) / (start + curr_velo) + (2 * turn_dist) / (curr_velo + end) \
+            + (lengths - 2 * turn_dist) / curr_velo
+        short_time = (2 * lengths) / (prev_velo + next_velo)
+    return np.where(lengths > 2 * turn_dist, full_time, short_time)  # hours
@@ -1,13 +1,146 @@
 import os
 import json
+import time
+import uuid
+import signal
+import argparse
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import shapefile  # You need to install pyshp (pip install pyshp)
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+from daemon import plan_request, warm_worker
+from plan_cache import PLAN_CACHE_PATH
 
-UPLOAD_FOLDER = '/Users/qiwen/Downloads/kidrone/electron/gui/assets/uploads'
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Folder the uploaded shapefiles are saved in, by default the GUI's uploads folder next to the engine
+UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'gui', 'assets', 'uploads')
+
+# Jobs waiting or running at once. Further submissions are refused with 429 until one finishes.
+MAX_PENDING_JOBS = 8
+# Finished jobs whose status and result are kept, the oldest ones are forgotten first
+KEEP_FINISHED_JOBS = 100
+# Seconds a client refused with 429 is asked to wait before submitting again
+RETRY_AFTER = 5
+
+FINISHED = ('done', 'failed', 'cancelled')
+
+
+class JobQueue:
+    """
+    Bounded queue of planning jobs, run in a pool of worker processes (see daemon.plan_request()).
+    Every job gets an ID its status and result are looked up with. A job is 'queued', 'running', then 'done',
+    'failed' or 'cancelled'.
+    """
+
+    def __init__(self, workers=1, max_pending=MAX_PENDING_JOBS, keep_finished=KEEP_FINISHED_JOBS,
+                 cache_path=PLAN_CACHE_PATH):
+        """
+        workers:        number of worker processes planning jobs concurrently
+        max_pending:    maximum number of jobs queued or running at once
+        keep_finished:  number of finished jobs kept for their status and result
+        cache_path:     sqlite file of the workers' PlanCache, None keeps their cache in memory only
+        """
+        self.workers = workers
+        self.max_pending = max_pending
+        self.keep_finished = keep_finished
+        # spawned rather than forked, so the workers never inherit the listening socket of the server
+        self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                         initializer=warm_worker, initargs=(cache_path,))
+        # cancelling a queued future runs its callback right away, in the thread holding the lock
+        self._lock = threading.RLock()
+        self._jobs = OrderedDict()
+        self._pending = 0
+
+    def submit(self, params):
+        """Queues a planning job. Returns its status, or None if the queue is full.
+
+        params: parameters of daemon.plan_request()
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                return None
+            job = {'id': uuid.uuid4().hex, 'status': 'queued', 'submitted': time.time(), 'finished': None,
+                   'error': None, 'result': None}
+            job['future'] = self._pool.submit(plan_request, params)
+            self._jobs[job['id']] = job
+            self._pending += 1
+        job['future'].add_done_callback(lambda future: self._finish(job))
+        return self.status(job['id'])
+
+    def status(self, job_id):
+        """Returns the status of a job, or None if there is no such job"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            status = job['status']
+            if status == 'queued' and job['future'].running():
+                status = 'running'
+            return {'job': job['id'], 'status': status, 'submitted': job['submitted'], 'finished': job['finished'],
+                    'error': job['error']}
+
+    def result(self, job_id):
+        """Returns (status, result) of a job, the result being None until the job is done.
+        Returns None if there is no such job.
+        """
+        with self._lock:
+            status = self.status(job_id)
+            return None if status is None else (status, self._jobs[job_id]['result'])
+
+    def cancel(self, job_id):
+        """Cancels a job. A queued job never runs, a running job finishes in its worker but its result is dropped.
+        Returns its status, or None if there is no such job. A finished job is left as it is.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job['status'] not in FINISHED:
+                job['future'].cancel()
+                job['status'] = 'cancelled'
+                job['finished'] = time.time()
+            return self.status(job_id)
+
+    def stats(self) -> dict:
+        """Returns the number of jobs per status and the capacity of the queue"""
+        with self._lock:
+            counts = {}
+            for job_id in self._jobs:
+                status = self.status(job_id)['status']
+                counts[status] = counts.get(status, 0) + 1
+            return {'jobs': counts, 'pending': self._pending, 'max_pending': self.max_pending, 'workers': self.workers}
+
+    def shutdown(self):
+        """Cancels the queued jobs and waits for the running ones"""
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def _finish(self, job):
+        """Records the outcome of a job once its future is done"""
+        future = job['future']
+        with self._lock:
+            self._pending -= 1
+            if job['status'] != 'cancelled':
+                job['finished'] = time.time()
+                if future.cancelled():
+                    job['status'] = 'cancelled'
+                elif future.exception() is not None:
+                    job['status'] = 'failed'
+                    job['error'] = f"{type(future.exception()).__name__}: {future.exception()}"
+                else:
+                    job['status'] = 'done'
+                    job['result'] = future.result()
+            # forget the oldest finished jobs
+            finished = [job_id for job_id, other in self._jobs.items() if other['status'] in FINISHED]
+            for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+                del self._jobs[job_id]
 
 
 class RequestHandler(BaseHTTPRequestHandler):
+    # uploads share one set of files in the upload folder, so they are handled one at a time
+    upload_lock = threading.Lock()
+
     def do_POST(self):
         if self.path == '/upload':
             content_length = int(self.headers['Content-Length'])
@@ -17,28 +150,72 @@ class RequestHandler(BaseHTTPRequestHandler):
             if not all(ext in files for ext in ['shp', 'shx', 'dbf']):
                 self.respond(
                     400, {'success': False, 'error': 'Incomplete shapefile'})
+                return
 
-            shapefile_path = self.save_shapefile(files)
-            polygons = self.process_shapefile(shapefile_path)
-
-            with open(os.path.join(UPLOAD_FOLDER, 'polygons.json'), 'w') as f:
-                json.dump(polygons, f)
+            with self.upload_lock:
+                shapefile_path = self.save_shapefile(files)
+                polygons = self.process_shapefile(shapefile_path)
 
-            self.respond(200, {'success': True})
+            # the polygons are answered right away rather than left in a file to fetch
+            self.respond(200, {'success': True, 'polygons': polygons})
+        elif self.path == '/jobs':
+            params = self.read_json()
+            if not isinstance(params, dict) or 'coords' not in params or 'disp_diam' not in params:
+                self.respond(400, {'success': False, 'error': 'Expected a JSON object with coords and disp_diam'})
+                return
+            status = self.server.jobs.submit(params)
+            if status is None:
+                self.respond(429, {'success': False, 'error': 'Job queue is full'},
+                             headers={'Retry-After': str(RETRY_AFTER)})
+                return
+            self.respond(202, status, headers={'Location': f"/jobs/{status['job']}"})
         else:
             self.respond(404, {'success': False, 'error': 'Not found'})
 
     def do_GET(self):
-        if self.path == '/uploads/polygons.json':
-            try:
-                with open(os.path.join(UPLOAD_FOLDER, 'polygons.json'), 'r') as f:
-                    polygons = json.load(f)
-                self.respond(200, polygons)
-            except Exception as e:
-                self.respond(500, {'success': False, 'error': str(e)})
+        parts = self.path.strip('/').split('/')
+        if parts == ['jobs']:
+            self.respond(200, self.server.jobs.stats())
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            status = self.server.jobs.status(parts[1])
+            if status is None:
+                self.respond(404, {'success': False, 'error': 'Unknown job'})
+                return
+            self.respond(200, status)
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'result':
+            found = self.server.jobs.result(parts[1])
+            if found is None:
+                self.respond(404, {'success': False, 'error': 'Unknown job'})
+                return
+            status, result = found
+            if status['status'] != 'done':
+                self.respond(409, dict(status, success=False))
+                return
+            self.respond(200, dict(status, result=result))
+        else:
+            self.respond(404, {'success': False, 'error': 'Not found'})
+
+    def do_DELETE(self):
+        parts = self.path.strip('/').split('/')
+        if len(parts) == 2 and parts[0] == 'jobs':
+            status = self.server.jobs.cancel(parts[1])
+            if status is None:
+                self.respond(404, {'success': False, 'error': 'Unknown job'})
+            elif status['status'] != 'cancelled':
+                self.respond(409, dict(status, success=False))
+            else:
+                self.respond(200, status)
         else:
             self.respond(404, {'success': False, 'error': 'Not found'})
 
+    def read_json(self):
+        """Returns the JSON body of the request, or None if it is not valid JSON"""
+        content_length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(content_length))
+        except ValueError:
+            return None
+
     def parse_multipart(self, post_data):
         boundary = self.headers['Content-Type'].split('boundary=')[-1]
         parts = post_data.split(boundary.encode())
@@ -55,7 +232,7 @@ class RequestHandler(BaseHTTPRequestHandler):
         return files
 
     def save_shapefile(self, files):
-        base_path = os.path.join(UPLOAD_FOLDER, 'uploaded_shapefile')
+        base_path = os.path.join(self.server.upload_folder, 'uploaded_shapefile')
         for ext, data in files.items():
             with open(f"{base_path}.{ext}", 'wb') as f:
                 f.write(data)
@@ -71,19 +248,56 @@ class RequestHandler(BaseHTTPRequestHandler):
 
         return polygons
 
-    def respond(self, status_code, data):
+    def respond(self, status_code, data, headers=None):
+        body = json.dumps(data, default=to_json).encode()
         self.send_response(status_code)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        self.wfile.write(body)
+
+
+def to_json(value):
+    """Converts the NumPy values of a planning result (e.g. the path vertices) for json.dumps()"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
 
 
-def run(server_class=HTTPServer, handler_class=RequestHandler, port=8000):
+def run(server_class=ThreadingHTTPServer, handler_class=RequestHandler, port=8000, workers=1,
+        max_pending=MAX_PENDING_JOBS, upload_folder=UPLOAD_FOLDER):
+    """Serves uploads and planning jobs. With the default ThreadingHTTPServer every client is handled in its own
+    thread, so a slow upload or a long plan never blocks the others. HTTPServer handles one request at a time.
+    SIGTERM stops the server like Ctrl+C: the queued jobs are cancelled and the workers stopped before exiting."""
+    os.makedirs(upload_folder, exist_ok=True)
     server_address = ('', port)
     httpd = server_class(server_address, handler_class)
+    httpd.upload_folder = upload_folder
+    httpd.jobs = JobQueue(workers, max_pending)
+
+    def terminate(signum, frame):
+        # shutdown() waits for serve_forever() to return, which runs in this very thread
+        threading.Thread(target=httpd.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, terminate)
     print(f'Starting server on port {port}')
-    httpd.serve_forever()
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.jobs.shutdown()
+        httpd.server_close()
 
 
 if __name__ == '__main__':
-    run()
+    parser = argparse.ArgumentParser(description="Upload and planning job server of the engine")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes planning jobs")
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING_JOBS,
+                        help="jobs queued or running at once before submissions are refused with 429")
+    parser.add_argument("--upload-folder", default=UPLOAD_FOLDER, help="folder the uploaded shapefiles are saved in")
+    args = parser.parse_args()
+    run(port=args.port, workers=args.workers, max_pending=args.max_pending, upload_folder=args.upload_folder)
@@ -0,0 +1,90 @@
+# src/tiling.py
+
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+from coverage import swath_coverage, coverage_metrics
+
+"""
+==============
+=== Tiling ===
+==============
+
+Description of the tiled planning mode used for very large fields.
+
+#TL:DR
+The swath lines of a path are grouped into strips of consecutive lines, aligned with the sweep direction.
+Each strip (tile) only buffers the part of the path that can reach it, and clips its coverage to the strip, so
+the coverage metrics of the tiles add up to the metrics of the whole path. Tiles are independent and can be
+evaluated in parallel; peak memory is bounded by the tile size instead of the field size.
+"""
+
+# Number of swath lines per tile
+DEFAULT_TILE_SWATHS = 50
+
+
+def swath_tiles(vertices, swath, ends, along, disp_diam, tile_swaths=DEFAULT_TILE_SWATHS) -> list[tuple]:
+    """Splits a path woven from 'swath' into strips of 'tile_swaths' consecutive swath lines.
+    Returns (vertices, strip) for every tile: the vertices of the part of the path that can cover the strip
+    (the tile's lines, plus the neighbouring lines within disp_diam of it), and the strip as a Polygon.
+
+    vertices:       (N, 2) vertex array of the path, woven from 'swath' and 'ends' (see Outline.weave_swath)
+    swath, ends:    the output of Outline.swath_set()
+    along:          unit vector of the baseline, see Outline.sweep_axes()
+    disp_diam:      dispersion diameter of the drone
+    tile_swaths:    number of swath lines per tile
+    """
+    num_swath = len(swath)
+    # index of the first vertex of every swath line (and the end of the last one)
+    starts = np.cumsum([1 if ends[0] is not None else 0] + [len(line) for line in swath])
+    # position of every swath line along the baseline
+    levels = np.array([line[0] @ along for line in swath])
+    if num_swath > 1 and levels[-1] < levels[0]:
+        along, levels = -along, -levels
+    across = np.array([-along[1], along[0]])
+
+    # the strips extend beyond the path, so the first and last tiles hold all of its coverage
+    position = vertices @ along
+    front, rear = position.min() - disp_diam, position.max() + disp_diam
+    width = np.abs(vertices @ across).max() + disp_diam
+
+    tiles = []
+    for a in range(0, num_swath, tile_swaths):
+        b = min(a + tile_swaths, num_swath)
+        low = (levels[a - 1] + levels[a]) / 2 if a > 0 else front
+        high = (levels[b - 1] + levels[b]) / 2 if b < num_swath else rear
+
+        # neighbouring lines close enough to cover part of the strip
+        context_a, context_b = a, b
+        while context_a > 0 and low - levels[context_a - 1] < disp_diam:
+            context_a -= 1
+        while context_b < num_swath and levels[context_b] - high < disp_diam:
+            context_b += 1
+        # include the intermediate lines joining the context to the rest of the path
+        first = starts[context_a] - 1 if context_a > 0 else 0
+        last = starts[context_b] + 1 if context_b < num_swath else len(vertices)
+
+        strip = Polygon([low * along - width * across, high * along - width * across,
+                         high * along + width * across, low * along + width * across])
+        tiles.append((vertices[first:last], strip))
+    return tiles
+
+
+def tile_metrics(vertices, strip, disp_diam, outer_poly, outline) -> dict:
+    """Computes the coverage metrics of the part of a path within one strip, see coverage_metrics()
+
+    vertices:   (N, 2) vertex array of the part of the path that can cover the strip, see swath_tiles()
+    strip:      the strip of the tile, as a Polygon
+    disp_diam:  dispersion diameter of the drone
+    outer_poly: the Outline of the whole field
+    outline:    the Outline the path was generated from
+    """
+    coverage = shapely.intersection(swath_coverage(vertices, disp_diam), strip)
+    return coverage_metrics(coverage, outer_poly, outline)
+
+
+def merge_metrics(metrics) -> dict:
+    """Adds up the coverage metrics of all tiles of a path into the metrics of the whole path"""
+    merged = {key: sum(m[key] for m in metrics) for key in ['seed_disp_area', 'total_covered_area', 'excluded_covered_area']}
+    merged['desired_coverage'] = metrics[0]['desired_coverage']
+    return {key: merged[key] for key in metrics[0]}
@@ -0,0 +1,66 @@
+# src/transform.py
+
+import numpy as np
+from functools import lru_cache
+from pyproj import Transformer
+
+"""
+=================================
+=== Coordinate Transformation ===
+=================================
+
+All CRS conversions in the engine go through this module.
+
+#TL:DR
+One pyproj Transformer is built per (from_crs, to_crs) pair and cached for the lifetime of the process.
+Coordinates are transformed as a whole (N, 2) NumPy array in a single call instead of point by point.
+"""
+
+# CRS used throughout the engine
+GCS = "EPSG:4326"       # lon & lat
+PCS = "EPSG:3857"       # meters, the working CRS of Outline and Path
+BCCS = "EPSG:3005"      # meters, BC Albers. Default CRS of the shapefiles we receive
+
+
+@lru_cache(maxsize=None)
+def get_transformer(from_crs, to_crs) -> Transformer:
+    """Returns the cached Transformer converting 'from_crs' to 'to_crs'.
+    Axis order is always (x, y) / (lon, lat).
+
+    from_crs, to_crs: anything pyproj accepts as a CRS (e.g. "EPSG:3857"). Must be hashable.
+    """
+    return Transformer.from_crs(from_crs, to_crs, always_xy=True)
+
+
+def as_coord_array(coords) -> np.ndarray:
+    """Returns 'coords' as a contiguous (N, 2) float64 array.
+
+    coords: a list of (x, y) tuples / lists, or an array-like of shape (N, 2)
+    """
+    arr = np.ascontiguousarray(coords, dtype=np.float64)
+    if arr.size == 0:
+        return arr.reshape(0, 2)
+    assert arr.ndim == 2 and arr.shape[1] == 2, "coordinates should be of shape (N, 2)"
+    return arr
+
+
+def transform_coords(coords, from_crs, to_crs) -> np.ndarray:
+    """Transforms all coordinates from 'from_crs' to 'to_crs' in one vectorized call.
+    Returns an (N, 2) float64 array.
+
+    coords:     a list of (x, y) coordinates, or an (N, 2) array
+    from_crs:   CRS of the input coordinates
+    to_crs:     CRS of the output coordinates
+    """
+    arr = as_coord_array(coords)
+    if from_crs == to_crs or len(arr) == 0:
+        return arr.copy()
+    if from_crs == GCS and (np.abs(arr[:, 1]) > 90).any():
+        raise ValueError("Latitude not in range. Input is lon, lat, you may have reversed them.")
+
+    x, y = get_transformer(from_crs, to_crs).transform(arr[:, 0], arr[:, 1])
+    out = np.column_stack((x, y))
+    if not np.isfinite(out).all():
+        raise ValueError(
+            "input should be in sequence of (Longtitude, Latitude), it may be currently reversed")
+    return out
@@ -1,6 +1,5 @@
 import { switchSubTab } from "./landing.js";
 import { displaySettingsValues } from "./setting.js";
-// import { run_python_script } from "./script_linker_test.js";
 
 const dropPinButton = document.getElementById("planFlightBtn");
 dropPinButton.addEventListener("click", () => {
@@ -25,10 +24,4 @@ dropPinButton.addEventListener("click", () => {
     });
 });
 
-// //Generate the flight path shapefile by calling python script
-// const generateFlightBtn = document.getElementById("generateFlightBtn");
-// generateFlightBtn.addEventListener("click", () => {
-//     var message = localStorage.getItem('settingsValues') + '\n';
-//     run_python_script(message);
-// })
-
+//Generating the flight paths is handled in map.js, which plans the uploaded polygons through the engine daemon
@@ -80,43 +80,71 @@ require([
       }
   }
 
+  // Polygons of the last uploaded shapefile, as PackedArrays of vertices in EPSG:3857 (see linkers/engine_daemon.js)
+  let blockPolygons = [];
+
   document.getElementById("saveBlockBtn").addEventListener("click", function() {
       const fileInput = document.getElementById("uploadShape");
-      const files = fileInput.files;
+      const files = Array.from(fileInput.files);
+      const shpFile = files.find(file => file.name.toLowerCase().endsWith(".shp"));
 
       if (files.length === 0) {
           alert("Please upload a shapefile.");
           return;
       }
-
-      const formData = new FormData();
-      for (let i = 0; i < files.length; i++) {
-          formData.append("files[]", files[i]);
+      if (shpFile === undefined) {
+          alert("File upload failed: Incomplete shapefile");
+          return;
       }
 
-      fetch("http://localhost:8000/upload", {
-          method: "POST",
-          body: formData
-      })
-      .then(response => response.json())
-      .then(result => {
-          if (result.success) {
-              fetch("http://localhost:8000/uploads/polygons.json")
-              .then(response => response.json())
-              .then(polygons => {
-                  console.log("Polygons loaded:", polygons);
-                  addPolygonsAndPoints(polygons);
-              })
-              .catch(error => {
-                  console.error("Error loading polygons:", error);
-              });
-          } else {
-              document.getElementById("result").textContent = "File upload failed: " + result.error;
-              document.getElementById("result").style.display = "block";
-          }
+      // The engine daemon reads the shapefile where it is (its .shx and .dbf next to it)
+      // and sends the polygons back as packed arrays, no file is written in between
+      window.engine.polygons(shpFile.path)
+      .then(polygons => {
+          console.log("Polygons loaded:", polygons);
+          blockPolygons = polygons;
+          addPolygonsAndPoints(polygons.map(polygon => polygon.toPairs()));
       })
       .catch(error => {
-          console.error("Error uploading file:", error);
+          console.error("Error loading polygons:", error);
+          alert("File upload failed: " + error.message);
+      });
+  });
+
+  function addPath(vertices) {
+      const pathGraphic = new Graphic({
+          geometry: {
+              type: "polyline",
+              paths: [vertices.toPairs()],
+              spatialReference: { wkid: 3857 },
+          },
+          symbol: {
+              type: "simple-line",
+              color: "#8A2BE2",
+              width: "2",
+          },
+      });
+      graphicsLayer.add(pathGraphic);
+  }
+
+  // Plan the best path of every uploaded polygon with the saved dispersion diameter (see setting.js)
+  document.getElementById("generateFlightBtn").addEventListener("click", function() {
+      if (blockPolygons.length === 0) {
+          alert("Please upload a shapefile.");
+          return;
+      }
+      const settings = new Map(JSON.parse(localStorage.getItem("settingsValues")));
+      const dispDiam = parseFloat(settings.get("dispersionDiameter"));
+
+      blockPolygons.forEach(function (polygon) {
+          window.engine.plan(polygon, dispDiam)
+          .then(result => {
+              console.log("Path planned:", result);
+              addPath(result.vertices);
+          })
+          .catch(error => {
+              console.error("Error planning path:", error);
+          });
       });
   });
 });
@@ -0,0 +1,216 @@
+// Client of the long-lived engine process (engine/daemon.py).
+// The daemon is started once and answers binary frames on its stdin / stdout (see engine/ipc.py):
+// an 8-byte header (big-endian uint32 sizes of a JSON part and of a binary payload), the JSON part, then the payload.
+// Coordinate arrays travel in the payload as packed little-endian float64, referenced from the JSON part by
+// {"$array": shape, "offset": byte offset in the payload}.
+// The main process owns the one EngineDaemon of the app and serves the renderers with serveRenderers(),
+// renderers send their requests through an EngineClient.
+
+const { spawn } = require('child_process');
+const path = require('path');
+
+const HEADER_SIZE = 8;
+const ARRAY_KEY = '$array';
+// IPC channel the renderers' requests travel on to the main process
+const ENGINE_CHANNEL = 'engine-daemon';
+
+// A float64 array with its shape, e.g. the (N, 2) vertices of a polygon or of a path
+class PackedArray {
+    constructor(data, shape) {
+        this.data = data;
+        this.shape = shape || [data.length];
+    }
+
+    // Packs a list of [x, y] coordinates
+    static fromPairs(pairs) {
+        const data = new Float64Array(pairs.length * 2);
+        pairs.forEach((pair, i) => {
+            data[2 * i] = pair[0];
+            data[2 * i + 1] = pair[1];
+        });
+        return new PackedArray(data, [pairs.length, 2]);
+    }
+
+    // Returns the rows of an (N, 2) array as a list of [x, y] coordinates
+    toPairs() {
+        const pairs = [];
+        for (let i = 0; i < this.shape[0]; i++) {
+            pairs.push([this.data[2 * i], this.data[2 * i + 1]]);
+        }
+        return pairs;
+    }
+}
+
+// Turns the {data, shape} objects a PackedArray becomes when sent between processes by Electron back into PackedArrays
+function revive(value) {
+    if (value instanceof PackedArray || value === null || typeof value !== 'object') {
+        return value;
+    }
+    if (value.data instanceof Float64Array && Array.isArray(value.shape)) {
+        return new PackedArray(value.data, value.shape);
+    }
+    if (Array.isArray(value)) {
+        return value.map(revive);
+    }
+    const revived = {};
+    for (const key of Object.keys(value)) {
+        revived[key] = revive(value[key]);
+    }
+    return revived;
+}
+
+function encodeMessage(message) {
+    const buffers = [];
+    let offset = 0;
+    const json = JSON.stringify(message, (key, value) => {
+        if (value instanceof PackedArray) {
+            const bytes = Buffer.from(value.data.buffer, value.data.byteOffset, value.data.byteLength);
+            buffers.push(bytes);
+            const ref = { [ARRAY_KEY]: value.shape, offset: offset };
+            offset += bytes.length;
+            return ref;
+        }
+        return value;
+    });
+    let body = Buffer.from(json, 'utf8');
+    // pad the JSON part so the payload is 8-byte aligned within the frame
+    const padding = (8 - (HEADER_SIZE + body.length) % 8) % 8;
+    body = Buffer.concat([body, Buffer.alloc(padding, ' ')]);
+    const header = Buffer.alloc(HEADER_SIZE);
+    header.writeUInt32BE(body.length, 0);
+    header.writeUInt32BE(offset, 4);
+    return Buffer.concat([header, body].concat(buffers));
+}
+
+function decodeMessage(frame, jsonSize) {
+    return JSON.parse(frame.subarray(0, jsonSize).toString('utf8'), (key, value) => {
+        if (value !== null && typeof value === 'object' && ARRAY_KEY in value) {
+            const shape = value[ARRAY_KEY];
+            const count = shape.reduce((a, b) => a * b, 1);
+            const start = frame.byteOffset + jsonSize + value.offset;
+            // view the payload in place when it is aligned, copy it otherwise
+            const data = start % 8 === 0
+                ? new Float64Array(frame.buffer, start, count)
+                : new Float64Array(frame.buffer.slice(start, start + count * 8));
+            return new PackedArray(data, shape);
+        }
+        return value;
+    });
+}
+
+// Requests of the engine, sent with the request(method, params) of a subclass
+class EngineRequests {
+    // Reads the polygons of a shapefile (with its .shx and .dbf next to it), see polygons_request() in daemon.py.
+    // The result is a list of PackedArrays of vertices in EPSG:3857.
+    polygons(shapePath) {
+        return this.request('polygons', { shape_path: shapePath });
+    }
+
+    // Plans the best path of one polygon given in EPSG:3857, see plan_request() in daemon.py.
+    // The vertices of the result are a PackedArray.
+    plan(coords, dispDiam, options = {}) {
+        const pack = (c) => (c instanceof PackedArray ? c : PackedArray.fromPairs(c));
+        const params = Object.assign({ coords: pack(coords), disp_diam: dispDiam }, options);
+        if (options.children) {
+            params.children = options.children.map(pack);
+        }
+        return this.request('plan', params);
+    }
+
+    // Writes planned paths to best_path.shp and / or projected_coordinates.json, see export_request() in daemon.py
+    export(paths, files) {
+        return this.request('export', Object.assign({ paths: paths }, files));
+    }
+
+    health() {
+        return this.request('health');
+    }
+
+    recycle() {
+        return this.request('recycle');
+    }
+}
+
+class EngineDaemon extends EngineRequests {
+    constructor(options = {}) {
+        super();
+        const python = options.python || 'python';
+        const script = options.script || path.join(__dirname, '../../engine/daemon.py');
+        const args = [script, '--workers', String(options.workers || 1)];
+
+        this.nextId = 1;
+        this.pending = new Map();
+        this.buffer = Buffer.alloc(0);
+
+        this.process = spawn(python, args, { stdio: ['pipe', 'pipe', 'inherit'] });
+        this.process.stdout.on('data', (chunk) => this.receive(chunk));
+        this.process.on('exit', (code) => {
+            // Fail every request still waiting for an answer
+            for (const { reject } of this.pending.values()) {
+                reject(new Error('Engine daemon exited with code ' + code));
+            }
+            this.pending.clear();
+        });
+    }
+
+    // Sends a request and returns a Promise of its result
+    request(method, params = {}) {
+        const id = this.nextId++;
+        return new Promise((resolve, reject) => {
+            this.pending.set(id, { resolve: resolve, reject: reject });
+            this.process.stdin.write(encodeMessage({ id: id, method: method, params: params }));
+        });
+    }
+
+    // Finishes the running plans, then stops the daemon
+    shutdown() {
+        const done = this.request('shutdown');
+        this.process.stdin.end();
+        return done;
+    }
+
+    // Splits the stdout stream into frames and settles the matching requests
+    receive(chunk) {
+        this.buffer = this.buffer.length ? Buffer.concat([this.buffer, chunk]) : chunk;
+        while (this.buffer.length >= HEADER_SIZE) {
+            const jsonSize = this.buffer.readUInt32BE(0);
+            const frameSize = HEADER_SIZE + jsonSize + this.buffer.readUInt32BE(4);
+            if (this.buffer.length < frameSize) {
+                break;
+            }
+            const message = decodeMessage(this.buffer.subarray(HEADER_SIZE, frameSize), jsonSize);
+            this.buffer = this.buffer.subarray(frameSize);
+
+            const request = this.pending.get(message.id);
+            if (request === undefined) {
+                continue;
+            }
+            this.pending.delete(message.id);
+            if (message.ok) {
+                request.resolve(message.result);
+            } else {
+                request.reject(new Error(message.error));
+            }
+        }
+    }
+}
+
+// Client of the main process' EngineDaemon, for a renderer
+class EngineClient extends EngineRequests {
+    constructor() {
+        super();
+        this.ipcRenderer = require('electron').ipcRenderer;
+    }
+
+    // Sends a request to the daemon through the main process and returns a Promise of its result
+    request(method, params = {}) {
+        return this.ipcRenderer.invoke(ENGINE_CHANNEL, method, params).then(revive);
+    }
+}
+
+// Answers the requests of every EngineClient with 'daemon', in the main process
+function serveRenderers(daemon, ipcMain) {
+    ipcMain.handle(ENGINE_CHANNEL, (event, method, params) => daemon.request(method, revive(params)));
+}
+
+module.exports = { EngineDaemon, EngineClient, PackedArray, serveRenderers };
@@ -1,6 +1,9 @@
-const { app, BrowserWindow } = require('electron')
+const { app, BrowserWindow, ipcMain } = require('electron')
 const path = require('node:path')
-const { exec } = require('child_process')
+const { EngineDaemon, serveRenderers } = require('./linkers/engine_daemon')
+
+// The one engine process of the app, started once and shared by every window (see linkers/engine_daemon.js)
+let engineDaemon = null
 
 function createWindow () {
   // Create the browser window.
@@ -22,31 +25,13 @@ function createWindow () {
 
   // Open the DevTools.
   mainWindow.webContents.openDevTools()
-
-  // Start the Python server
-  const pyProcess = exec('python /Users/qiwen/Downloads/kidrone/electron/engine/server.py', (error, stdout, stderr) => {
-    if (error) {
-      console.error(`Error starting Python server: ${error.message}`)
-      return
-    }
-
-    if (stderr) {
-      console.error(`Python server stderr: ${stderr}`)
-      return
-    }
-
-    console.log(`Python server stdout: ${stdout}`)
-  })
-
-  // Ensure Python process is terminated when Electron app is closed
-  mainWindow.on('closed', () => {
-    pyProcess.kill()
-  })
 }
 
 // This method will be called when Electron has finished
 // initialization and is ready to create browser windows.
 app.whenReady().then(() => {
+  engineDaemon = new EngineDaemon()
+  serveRenderers(engineDaemon, ipcMain)
   createWindow()
 
   app.on('activate', function () {
@@ -63,5 +48,13 @@ app.on('window-all-closed', function () {
   if (process.platform !== 'darwin') app.quit()
 })
 
+// Stop the engine when the app exits, it finishes its running plans first
+app.on('will-quit', () => {
+  if (engineDaemon !== null) {
+    engineDaemon.shutdown().catch((error) => console.error(`Engine daemon: ${error.message}`))
+    engineDaemon = null
+  }
+})
+
 // In this file you can include the rest of your app's specific main process
 // code. You can also put them in separate files and require them here.
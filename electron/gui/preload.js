@@ -6,6 +6,11 @@
  *
  * https://www.electronjs.org/docs/latest/tutorial/sandbox
  */
+const { EngineClient } = require('./linkers/engine_daemon')
+
+// Requests to the engine daemon of the main process, for every script of the page (see linkers/engine_daemon.js)
+window.engine = new EngineClient()
+
 window.addEventListener('DOMContentLoaded', () => {
   const replaceText = (selector, text) => {
     const element = document.getElementById(selector)